@@ -2,8 +2,8 @@
 # Chapter 1: Imports and Models
 # ===============================
 # This chapter defines the core data models for SEA-SEC events and reporting.
-from pydantic import BaseModel, HttpUrl, Field
-from typing import List, Optional, Dict
+from pydantic import BaseModel, HttpUrl, Field, PrivateAttr
+from typing import Any, List, Optional, Dict
 from datetime import datetime
 
 # ===============================
@@ -18,9 +18,13 @@ class SecurityEvent(BaseModel):
     has_login_form: bool
     headers: Dict[str, str] = {}
     note: Optional[str] = None
-    risk: Optional[int] = None           # NEW field
+    risk: Optional[float] = None         # NEW field (0..10, rules + ML)
     risk_reason: Optional[str] = None    # NEW field
     description: Optional[str] = None    # NEW field
+    anomaly_score: Optional[float] = None  # 0..1 ML risk written back by batch scoring
+    body_matches: Dict[str, int] = {}       # sensitive-data hits per rule id from the crawl-time body scan
+    body_snippets: List[str] = []           # redacted context for the first few body hits
+    _rule_context: Any = PrivateAttr(default=None)  # risk_rules.evaluate_event cache, never serialized
 
 # ===============================
 # Chapter 3: ML Training Result Model
@@ -33,9 +37,14 @@ class TrainResult(BaseModel):
 # Chapter 4: Report Summary Model
 # ===============================
 class ReportSummary(BaseModel):
+    report_id: Optional[str] = None                # pass to /report/events; records are paged from there
     total_events: int
     anomalies: int
+    by_risk_level: Optional[Dict[str, int]] = None
     report_html_path: str
     report_csv_path: str
     report_json_path: str
-    events: Optional[List[SecurityEvent]] = None   # NEW: embed detail
+    html_pages: Optional[Dict[str, int]] = None    # page count per HTML shard (all / high / medium / low)
+    archive_run: Optional[str] = None              # reports/archive/<run> this report was copied to
+    rule_stats: Optional[Dict[str, Any]] = None    # per-rule counters when RULE_STATS_ENABLED
+    renders: Optional[Dict[str, str]] = None       # pdf / png snapshot status when weasyprint is installed
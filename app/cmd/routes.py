@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Body, HTTPException, Depends, Security
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Body, HTTPException, Depends, Request, Security
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pathlib import Path
 from pydantic import BaseModel, HttpUrl
-import os, csv
+from typing import Optional
+import os, csv, json, asyncio, hashlib, mimetypes
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 
 # Import services
-from app.services.data_service import crawl_site, load_events, set_target_site, get_target_site
-from app.services.learning_service import train, score
-from app.services.reporting_service import generate
+from app.services.data_service import crawl_site, set_target_site, get_target_site, iter_event_chunks
+from app.services.learning_service import train_from_store, model_version, SCORE_CHUNK_SIZE, MODEL_STATS
+from app.services.reporting_service import generate, generate_delta, load_rollup, load_store_rollup, page_events, report_page_path, gz_path, REPORT_DIR, PAGE_SHARDS
+from app.services import archive_service, health_service, render_service
+from app.services.scoring_service import record_ingest, rescore_store, score_stream_offloaded
+from app.services.drift_service import drift_report
+from app.services.risk_rules import rule_stats, set_rule_stats
+from app.utils.executors import IO, CPU
 
 # Import Pydantic models
 from app.models import TrainResult, ReportSummary  # adjust import if TrainResult lives elsewhere
@@ -17,15 +24,22 @@ from app.models import TrainResult, ReportSummary  # adjust import if TrainResul
 # Setup
 # -------------------------------------------------
 router = APIRouter()
-reports_dir = Path("data/reports/latest")
+# Orchestrator probes, mounted at the app root (/livez, /readyz) rather than under /api
+probe_router = APIRouter()
+# Same directory reporting_service.generate writes to, so /report/latest/* serves the last run
+reports_dir = REPORT_DIR
 reports_dir.mkdir(parents=True, exist_ok=True)
+# Sent with every report download. The default makes clients revalidate each time, which costs
+# a stat() and a 304 while the report is unchanged; archived files are immutable and cache longer.
+REPORT_CACHE_CONTROL = os.getenv("REPORT_CACHE_CONTROL", "private, no-cache")
+ARCHIVE_CACHE_CONTROL = os.getenv("ARCHIVE_CACHE_CONTROL", "private, max-age=31536000, immutable")
 
 # -------------------------------------------------
 # Security (API Key demo)
 # -------------------------------------------------
 API_KEY = os.getenv("API_KEY", "changeme")
 
-def verify_api_key(x_api_key: str = Security(..., alias="X-API-Key")):
+async def verify_api_key(x_api_key: str = Security(..., alias="X-API-Key")):
     if x_api_key != API_KEY:
         raise HTTPException(status_code=403, detail="Forbidden")
 
@@ -38,43 +52,171 @@ class SitePayload(BaseModel):
 class IngestPayload(BaseModel):
     max_pages: int = 15
 
+class ScoreStreamPayload(BaseModel):
+    chunk_size: int = SCORE_CHUNK_SIZE
+
+class RuleStatsPayload(BaseModel):
+    enabled: bool = True
+    reset: bool = False
+
 # -------------------------------------------------
 # Routes
 # -------------------------------------------------
+# Handlers are async and never block the event loop: network and disk work runs on the
+# bounded IO thread pool, model training on the CPU process pool (utils/executors.py).
+# A full executor raises Saturated, which main.py turns into 429 + Retry-After.
 
 @router.get("/")
-def root():
-    return {"ok": True, "target_site": get_target_site()}
+async def root():
+    return {"ok": True, "target_site": health_service.STATE["target_site"]}
 
 # 1. Set Target Site
 @router.post("/set_site", dependencies=[Depends(verify_api_key)])
-def api_set_site(payload: SitePayload):
-    return {"target_site": set_target_site(str(payload.url))}
+async def api_set_site(payload: SitePayload):
+    target_site = await IO.run(set_target_site, str(payload.url))
+    health_service.remember_target_site(target_site)
+    return {"target_site": target_site}
 
 # 2. Crawl / Ingest Pages
+def _ingest(max_pages: int):
+    events = crawl_site(max_pages=max_pages, on_persist=record_ingest)
+    return {"collected": len(events), "target_site": get_target_site()}
+
 @router.post("/ingest/run", dependencies=[Depends(verify_api_key)])
-def api_ingest(payload: IngestPayload):
+async def api_ingest(payload: IngestPayload):
     if not (1 <= payload.max_pages <= 500):
         raise HTTPException(status_code=400, detail="max_pages must be between 1 and 500")
-    events = crawl_site(max_pages=payload.max_pages)
-    return {"collected": len(events), "target_site": get_target_site()}
+    return await IO.run(_ingest, payload.max_pages)
 
 # 3. Train Model
 @router.post("/learn/train", response_model=TrainResult, dependencies=[Depends(verify_api_key)])
-def api_train():
-    events = load_events()
-    return train(events)
+async def api_train():
+    # Loaded and fitted in a worker process (only the job crosses over, not the events); this
+    # worker picks the new artifact up when the file changes
+    return await CPU.run(train_from_store)
+
+# 3a. Model load / warm-up timings for this worker
+@router.get("/learn/model/stats", dependencies=[Depends(verify_api_key)])
+async def api_model_stats():
+    return MODEL_STATS
+
+# 3b. Feature drift since last training — retrain only when this says so
+@router.get("/learn/drift", dependencies=[Depends(verify_api_key)])
+async def api_drift():
+    return await IO.run(drift_report)
+
+# 3c. Stream-score the full event history in chunks, writing scores back to the store
+@router.post("/learn/score/stream", dependencies=[Depends(verify_api_key)])
+async def api_score_stream(payload: ScoreStreamPayload):
+    if not (1 <= payload.chunk_size <= 100_000):
+        raise HTTPException(status_code=400, detail="chunk_size must be between 1 and 100000")
+    # Fail before streaming starts; the rewrite itself only begins once IO picks it up
+    if await IO.run(model_version) is None:
+        raise HTTPException(status_code=409, detail="Model not found; train first.")
+    progress = rescore_store(payload.chunk_size)
+
+    # The whole rewrite holds one IO slot (admitted, or refused with 429, before streaming
+    # starts) and hands chunk sizes back to the event loop as they are written.
+    loop = asyncio.get_running_loop()
+    sizes: asyncio.Queue = asyncio.Queue()
+
+    def rewrite():
+        try:
+            for n in progress:
+                loop.call_soon_threadsafe(sizes.put_nowait, n)
+        finally:
+            loop.call_soon_threadsafe(sizes.put_nowait, None)
+
+    job = IO.submit(rewrite)
+
+    async def ndjson():
+        scored, i = 0, 0
+        while (n := await sizes.get()) is not None:
+            scored += n
+            yield json.dumps({"chunk": i, "size": n, "scored": scored}) + "\n"
+            i += 1
+        job.result()  # re-raise a failed rewrite instead of reporting it as done
+        yield json.dumps({"done": True, "scored": scored}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 # 4. Generate Risk Report
+def _generate_report(archive: bool):
+    # Runs on IO: reads chunks and writes the report as it goes, while each chunk is scored in
+    # the CPU pool. The response holds aggregates only; records are paged through /report/events
+    # with the returned report_id.
+    risks = score_stream_offloaded(iter_event_chunks(SCORE_CHUNK_SIZE), CPU.submit)
+    def archive_report(summary: dict) -> None:
+        # Archived runs are the base that /report/delta compares against. Runs under generate's
+        # report lock, so an overlapping generate cannot swap its files in before they are copied.
+        summary["archive_run"] = archive_service.archive_run(
+            summary={k: summary[k] for k in ("total_events", "anomalies", "html_pages")})
+
+    summary = generate(None, risks, on_commit=archive_report if archive else None)
+    summary.setdefault("archive_run", None)
+    stats = rule_stats()
+    summary["rule_stats"] = stats if stats["enabled"] else None
+    # PDF / PNG snapshots render in the background; /report/latest/pdf|png answer 202 until ready
+    if render_service.available():
+        summary["renders"] = {fmt: s["status"] for fmt, s in render_service.submit().items()}
+    return summary
+
 @router.post("/report/generate", response_model=ReportSummary, dependencies=[Depends(verify_api_key)])
-def api_report():
-    events = load_events()
-    risks = score(events)
-    return generate(events, risks)
+async def api_report(archive: bool = True):
+    return await IO.run(_generate_report, archive)
+
+# 4b. Only what changed since the last archived full report
+def _generate_delta():
+    base_run = archive_service.latest_run()
+    if base_run is None:
+        raise HTTPException(status_code=409, detail="No archived report yet; run /report/generate first.")
+    risks = score_stream_offloaded(iter_event_chunks(SCORE_CHUNK_SIZE), CPU.submit)
+    return generate_delta(risks, archive_service.iter_run_rows(base_run), base_run)
+
+@router.post("/report/delta", dependencies=[Depends(verify_api_key)])
+async def api_report_delta():
+    return await IO.run(_generate_delta)
+
+# 4c. Aggregate counts of the last report, straight from its rollup (no events are read).
+# "store" holds the whole event store's counts, kept current by ingest and rescoring; the
+# report's own counts always match what /report/events pages through.
+@router.get("/report/summary", dependencies=[Depends(verify_api_key)])
+async def api_report_summary():
+    rollup = await IO.run(load_rollup)
+    if rollup is None:
+        raise HTTPException(status_code=404, detail="No report yet; run /report/generate first.")
+    return {**rollup, "store": await IO.run(load_store_rollup)}
+
+# 4d. Records of the last report, a page at a time (cursor = position in the report's NDJSON)
+@router.get("/report/events", dependencies=[Depends(verify_api_key)])
+async def api_report_events(cursor: Optional[str] = None, risk_level: str = "all", limit: int = 100,
+                            fields: Optional[str] = None):
+    try:
+        return await IO.run(page_events, cursor, risk_level, limit, fields.split(",") if fields else None)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 4a. Per-rule invocation / hit / timing counters (collected only while enabled)
+@router.get("/rules/stats", dependencies=[Depends(verify_api_key)])
+async def api_rule_stats():
+    return rule_stats()
+
+@router.post("/rules/stats", dependencies=[Depends(verify_api_key)])
+async def api_set_rule_stats(payload: RuleStatsPayload):
+    # Toggling rebuilds the rule plan, which may re-read the rulebook
+    await IO.run(set_rule_stats, payload.enabled, reset=payload.reset)
+    return rule_stats()
 
 # 5. Download Reports
-def ensure_sample_reports():
-    """Helper to auto-generate sample CSV/HTML if missing."""
+_SAMPLES_READY = False
+
+def ensure_sample_reports(force: bool = False):
+    """Helper to auto-generate sample CSV/HTML if missing. Checks the disk once per process (or when forced)."""
+    global _SAMPLES_READY
+    if _SAMPLES_READY and not force:
+        return
     today = datetime.now().strftime("%B %d, %Y")
     month_year = datetime.now().strftime("%B %Y")
 
@@ -109,24 +251,188 @@ def ensure_sample_reports():
         html_path.write_text(html_content)
     if not json_path.exists():
         json_path.write_text('[{"sample":"report"}]')
+    _SAMPLES_READY = True
 
-@router.get("/report/latest/html", dependencies=[Depends(verify_api_key)])
-def api_report_html():
+def _accepts_gzip(request: Request) -> bool:
+    """An explicit gzip (or x-gzip) entry decides over "*"; q=0 in any spelling (q=0.000) refuses it."""
+    weights = {}
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, *params = [part.strip() for part in coding.split(";")]
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0  # unparseable weight: do not guess the client wants it
+        name = name.lower()
+        if name in ("gzip", "x-gzip", "*"):
+            weights[name] = max(q, weights.get(name, 0.0))
+    explicit = [weights[name] for name in ("gzip", "x-gzip") if name in weights]
+    if explicit:
+        return max(explicit) > 0
+    return weights.get("*", 0.0) > 0
+
+# Strong ETags are content hashes, remembered per (path, inode, mtime, size): reports are swapped
+# in atomically, so any new content shows up as a new key and a repeat poll only pays a stat().
+_ETAGS: dict = {}
+_ETAG_CACHE_SIZE = 256
+
+def content_etag(path: Path, st: os.stat_result) -> str:
+    key = (str(path), st.st_ino, st.st_mtime_ns, st.st_size)
+    etag = _ETAGS.get(key)
+    if etag is None:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        etag = f'"{h.hexdigest()}"'
+        if len(_ETAGS) >= _ETAG_CACHE_SIZE:
+            _ETAGS.clear()
+        _ETAGS[key] = etag
+    return etag
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2); INM uses weak comparison."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def serve_report_file(path: Path, request: Request, etag: Optional[str] = None,
+                      cache_control: Optional[str] = None, media_type: Optional[str] = None):
+    """
+    Sends the precompressed .gz sibling when the client accepts gzip and it is at least as new as the file.
+    Every response carries a strong ETag (the content hash of the bytes sent, or `etag` when the
+    caller already knows the file's hash), Last-Modified and Cache-Control; a matching
+    If-None-Match / If-Modified-Since gets an empty 304.
+    Range / If-Range requests are answered with 206 by FileResponse against that ETag.
+    """
+    global _SAMPLES_READY
+    media_type = media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": cache_control or REPORT_CACHE_CONTROL}
+    try:
+        st = os.stat(path)
+        gz = gz_path(path)
+        if _accepts_gzip(request) and gz.exists() and gz.stat().st_mtime_ns >= st.st_mtime_ns:
+            path, st = gz, os.stat(gz)
+            headers["Content-Encoding"] = "gzip"
+            etag = etag and f"{etag}-gz"
+        headers["ETag"] = f'"{etag}"' if etag else content_etag(path, st)
+    except FileNotFoundError:
+        _SAMPLES_READY = False  # the next download re-checks the sample reports
+        raise HTTPException(status_code=404, detail="Report file not found")
+    headers["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+    if _not_modified(request, headers["ETag"], st.st_mtime):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+def _serve_html(request: Request, page: Optional[int], level: str):
     ensure_sample_reports()
-    return FileResponse(reports_dir / "report.html")
+    if page is None:
+        return serve_report_file(reports_dir / "report.html", request)
+    if level not in PAGE_SHARDS:
+        raise HTTPException(status_code=400, detail=f"level must be one of {', '.join(PAGE_SHARDS)}")
+    path = report_page_path(level, page)
+    if page < 1 or not path.exists():
+        raise HTTPException(status_code=404, detail="No such report page")
+    return serve_report_file(path, request)
 
-@router.get("/report/latest/csv", dependencies=[Depends(verify_api_key)])
-def api_report_csv():
+def _serve_latest(name: str, request: Request, media_type: Optional[str] = None):
     ensure_sample_reports()
-    return FileResponse(reports_dir / "report.csv")
+    return serve_report_file(reports_dir / name, request, media_type=media_type)
+
+def _serve_latest_json(request: Request):
+    # The last run wrote report.json or report.ndjson (REPORT_JSON_FORMAT); its rollup says which
+    rollup = load_rollup()
+    name = rollup.get("json_file", "report.json") if rollup else "report.json"
+    return _serve_latest(name, request, "application/x-ndjson" if name.endswith(".ndjson") else None)
+
+# Stat / hash / 304 decisions run on the IO pool; FileResponse then streams the body asynchronously
+@router.get("/report/latest/html", dependencies=[Depends(verify_api_key)])
+async def api_report_html(request: Request, page: Optional[int] = None, level: str = "all"):
+    """Without ?page the small index; with it one page of the all / high / medium / low series."""
+    return await IO.run(_serve_html, request, page, level)
+
+@router.get("/report/latest/csv", dependencies=[Depends(verify_api_key)])
+async def api_report_csv(request: Request):
+    return await IO.run(_serve_latest, "report.csv", request)
 
 @router.get("/report/latest/json", dependencies=[Depends(verify_api_key)])
-def api_report_json():
+async def api_report_json(request: Request):
+    return await IO.run(_serve_latest_json, request)
+
+# 5a. PDF / PNG snapshots of report.html, cached per content hash
+def _snapshot(fmt: str):
     ensure_sample_reports()
-    return FileResponse(reports_dir / "report.json")
+    return render_service.snapshot(fmt)
+
+@router.get("/report/latest/{fmt}", dependencies=[Depends(verify_api_key)])
+async def api_report_snapshot(fmt: str):
+    if fmt not in render_service.RENDER_FORMATS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    try:
+        snapshot = await IO.run(_snapshot, fmt)
+    except (ImportError, NotImplementedError) as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    if snapshot["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"{fmt.upper()} rendering failed: {snapshot['error']}")
+    if snapshot["status"] == "rendering":
+        return JSONResponse(status_code=202, content=snapshot, headers={"Retry-After": "2"})
+    return FileResponse(snapshot["path"], media_type=mimetypes.guess_type(snapshot["path"])[0],
+                        filename=f"report.{fmt}")
+
+# 5b. Archived runs: listing comes from the archive index, files from content-addressed blobs
+@router.get("/report/archive", dependencies=[Depends(verify_api_key)])
+async def api_archive_index():
+    return await IO.run(archive_service.load_index)
+
+@router.get("/report/archive/{run_id}", dependencies=[Depends(verify_api_key)])
+async def api_archive_manifest(run_id: str):
+    try:
+        return await IO.run(archive_service.load_manifest, run_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def _serve_archived(run_id: str, name: str, request: Request):
+    try:
+        path = archive_service.artifact_path(run_id, name)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"{name} of run {run_id} is missing from the blob store")
+    # Blobs are named by their sha256, which doubles as the ETag; media type follows the archived name
+    return serve_report_file(path, request, etag=path.name, cache_control=ARCHIVE_CACHE_CONTROL,
+                             media_type=mimetypes.guess_type(name)[0])
+
+@router.get("/report/archive/{run_id}/{name:path}", dependencies=[Depends(verify_api_key)])
+async def api_archive_file(run_id: str, name: str, request: Request):
+    return await IO.run(_serve_archived, run_id, name, request)
 
 # 6. Health endpoint (always open, no API key required)
+# Target site comes from the health cache; sample reports are checked once per process
 @router.get("/health")
-def health_check():
-    ensure_sample_reports()
-    return {"status": "ok", "target_site": get_target_site()}
+async def health_check():
+    if not _SAMPLES_READY:
+        await IO.run(ensure_sample_reports)
+    if health_service.STATE["checked_at"] is None:  # app started without its startup hook (e.g. tests)
+        await IO.run(health_service.refresh)
+    return {"status": "ok", "target_site": health_service.STATE["target_site"]}
+
+# 7. Liveness / readiness probes (no API key; memory only, see health_service)
+@probe_router.get("/livez")
+async def livez():
+    return health_service.liveness()
+
+@probe_router.get("/readyz")
+async def readyz():
+    readiness = health_service.readiness()
+    return JSONResponse(status_code=200 if readiness["status"] == "ready" else 503, content=readiness)
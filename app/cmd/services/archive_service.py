@@ -0,0 +1,213 @@
+# ===============================
+# Chapter 1: Imports and Setup
+# ===============================
+# This chapter sets up the report archive. Every archived file is stored once as a content-addressed
+# blob (blobs/<sha256[:2]>/<sha256>); each run is a small manifest mapping its file names to blobs,
+# and index.json lists every run so listing and fetching never walk the archive directory.
+import os, csv, json, time, fcntl, shutil, hashlib, logging
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.services.reporting_service import REPORT_DIR, PAGE_DIR, report_lock
+
+ARCHIVE_DIR = REPORT_DIR / "archive"
+RUN_ID_FORMAT = "%Y%m%d_%H%M%S"
+ARCHIVED_FILES = ["report.json", "report.ndjson", "report.csv", "report.html", "rollup.json"]
+# Static assets the HTML links to (../Logo.png); stored once however many runs reference them
+REPORT_ASSETS = [Path(p) for p in os.getenv("REPORT_ASSETS", "Logo.png").split(",") if p]
+# GC leaves blobs younger than this alone: a run being archived writes blobs before its manifest
+GC_GRACE_SECONDS = int(os.getenv("ARCHIVE_GC_GRACE_SECONDS", "3600"))
+logger = logging.getLogger("sea-sec")
+
+def _blob_dir() -> Path:
+    return ARCHIVE_DIR / "blobs"
+
+def _manifest_path(run_id: str) -> Path:
+    return ARCHIVE_DIR / "manifests" / f"{run_id}.json"
+
+def _index_path() -> Path:
+    return ARCHIVE_DIR / "index.json"
+
+@contextmanager
+def _index_lock():
+    """
+    Developer Note: Exclusive flock on archive/index.lock around every index read-modify-write
+    and GC. A file lock, not a threading.Lock: uvicorn workers and archive_cli share the index.
+    """
+    lock_path = ARCHIVE_DIR / "index.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _write_json(path: Path, data: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2))
+    os.replace(tmp_path, path)
+
+# ===============================
+# Chapter 2: Blob Store
+# ===============================
+def blob_path(digest: str) -> Path:
+    return _blob_dir() / digest[:2] / digest
+
+def put_blob(path: Path) -> Dict[str, Any]:
+    """Developer Note: Stores a file under its sha256 unless that content is already archived."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    target = blob_path(digest)
+    if target.exists():
+        os.utime(target)  # freshly referenced: keep it inside GC's grace window
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + ".tmp")
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+    return {"sha256": digest, "size": path.stat().st_size}
+
+# ===============================
+# Chapter 3: Run Manifests and Index
+# ===============================
+def load_index() -> Dict[str, Any]:
+    """Developer Note: {"runs": {run_id: {...}}, "latest_report": run_id}; run ids sort by time."""
+    path = _index_path()
+    if not path.exists():
+        return {"runs": {}, "latest_report": None}
+    return json.loads(path.read_text())
+
+def _save_index(index: Dict[str, Any]) -> None:
+    with_report = [run_id for run_id, run in index["runs"].items() if run.get("has_report")]
+    index["latest_report"] = max(with_report) if with_report else None
+    _write_json(_index_path(), index)
+
+def _new_run_id() -> str:
+    run_id = datetime.now().strftime(RUN_ID_FORMAT)
+    base, suffix = run_id, 1
+    while _manifest_path(run_id).exists():  # two runs in the same second
+        run_id = f"{base}_{suffix:02d}"
+        suffix += 1
+    return run_id
+
+def _record_run(run_id: Optional[str], files: Dict[str, Path], summary: Optional[Dict[str, Any]]) -> str:
+    # Blobs first (outside the lock: the slow part; GC's grace window protects them), then the
+    # run id, manifest and index entry together, so two processes cannot claim the same id.
+    entries = {name: put_blob(path) for name, path in files.items()}
+    with _index_lock():
+        run_id = run_id or _new_run_id()
+        manifest = {"run_id": run_id, "created": datetime.now().isoformat(timespec="seconds"),
+                    "files": entries, "summary": summary or {}}
+        _write_json(_manifest_path(run_id), manifest)
+        index = load_index()
+        index["runs"][run_id] = {
+            "created": manifest["created"],
+            "files": len(entries),
+            "bytes": sum(e["size"] for e in entries.values()),
+            "has_report": "report.csv" in entries,
+        }
+        _save_index(index)
+    return run_id
+
+def archive_run(source: Path = None, summary: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Developer Note: Archives the current report files, HTML pages and static assets as a new run.
+    .gz siblings are not archived: gzip headers carry a timestamp, so they would never dedupe,
+    and they can be recreated from the plain file. Holds the report lock while reading, so a
+    report being generated is archived whole or not at all.
+    """
+    source = source or REPORT_DIR
+    with report_lock():
+        files: Dict[str, Path] = {name: source / name for name in ARCHIVED_FILES if (source / name).exists()}
+        if (source / PAGE_DIR).is_dir():
+            for page in sorted((source / PAGE_DIR).glob("*.html")):
+                files[f"{PAGE_DIR}/{page.name}"] = page
+        for asset in REPORT_ASSETS:
+            if asset.exists():
+                files[asset.name] = asset
+        return _record_run(None, files, summary)
+
+def latest_run() -> Optional[str]:
+    """Developer Note: Newest run that holds a CSV report, straight from the index."""
+    return load_index()["latest_report"]
+
+def load_manifest(run_id: str) -> Dict[str, Any]:
+    path = _manifest_path(run_id)
+    if not path.exists():
+        raise FileNotFoundError(f"No archived run {run_id}")
+    return json.loads(path.read_text())
+
+def artifact_path(run_id: str, name: str) -> Path:
+    """Developer Note: Blob holding file `name` of a run; FileNotFoundError if the run or file is unknown."""
+    entry = load_manifest(run_id)["files"].get(name)
+    if entry is None:
+        raise FileNotFoundError(f"{name} is not part of run {run_id}")
+    return blob_path(entry["sha256"])
+
+def iter_run_rows(run_id: str) -> Iterator[Dict[str, str]]:
+    """Developer Note: Streams an archived run's CSV rows (values are strings, as written)."""
+    with open(artifact_path(run_id, "report.csv"), newline="") as f:
+        yield from csv.DictReader(f)
+
+# ===============================
+# Chapter 4: Retention, GC and Legacy Import
+# ===============================
+def gc(keep: int, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Developer Note: Keeps the `keep` newest runs, drops the other manifests, then deletes every
+    blob no remaining manifest references. The mark phase reads every manifest on disk, not
+    only the indexed runs, so a manifest the index does not list yet still protects its blobs;
+    a run whose manifest is missing is logged and skipped. Blobs newer than GC_GRACE_SECONDS
+    are skipped so a run being archived right now survives.
+    """
+    with _index_lock():
+        index = load_index()
+        runs = sorted(index["runs"], reverse=True)
+        expired = runs[max(keep, 0):]
+        for run_id in runs:
+            if not _manifest_path(run_id).exists():
+                logger.warning(f"Archive run {run_id} is indexed but its manifest is missing; skipping it")
+        live = set()
+        manifests = ARCHIVE_DIR / "manifests"
+        for path in sorted(manifests.glob("*.json")) if manifests.is_dir() else []:
+            if path.stem not in expired:
+                live.update(entry["sha256"] for entry in json.loads(path.read_text())["files"].values())
+        removed_blobs, freed = 0, 0
+        cutoff = time.time() - GC_GRACE_SECONDS
+        if _blob_dir().is_dir():
+            for blob in _blob_dir().glob("*/*"):
+                if blob.name not in live and blob.stat().st_mtime < cutoff:
+                    removed_blobs += 1
+                    freed += blob.stat().st_size
+                    if not dry_run:
+                        blob.unlink()
+        if not dry_run:
+            for run_id in expired:
+                _manifest_path(run_id).unlink(missing_ok=True)
+                del index["runs"][run_id]
+            _save_index(index)
+    return {"removed_runs": expired, "removed_blobs": removed_blobs, "freed_bytes": freed, "dry_run": dry_run}
+
+def import_legacy(remove: bool = False) -> List[str]:
+    """Developer Note: Turns old full-copy folders (reports/archive/<timestamp>/) into manifests + blobs."""
+    imported = []
+    if not ARCHIVE_DIR.is_dir():
+        return imported
+    for folder in sorted(p for p in ARCHIVE_DIR.iterdir() if p.is_dir() and p.name not in ("blobs", "manifests")):
+        if _manifest_path(folder.name).exists():
+            continue
+        files = {str(p.relative_to(folder)): p for p in sorted(folder.rglob("*"))
+                 if p.is_file() and p.name != ".DS_Store"}
+        if not files:
+            continue
+        imported.append(_record_run(folder.name, files, {"imported_from": str(folder)}))
+        if remove:
+            shutil.rmtree(folder)
+    return imported
@@ -0,0 +1,137 @@
+# ===============================
+# Chapter 1: Imports and Setup
+# ===============================
+# This chapter sets up the persistent score cache that lets report generation skip unchanged events.
+import os, json, sqlite3, threading, hashlib, time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.services import learning_service, risk_rules
+
+SCORE_CACHE_PATH = Path(os.getenv("SCORE_CACHE_PATH", str(learning_service.DATA_DIR / "score_cache.sqlite")))
+SCORE_CACHE_MAX_ROWS = int(os.getenv("SCORE_CACHE_MAX_ROWS", "200000"))
+SCORE_CACHE_ENABLED = os.getenv("SCORE_CACHE_ENABLED", "1") == "1"
+
+# Fields that do not change an event's score: the score itself, and the crawl timestamp
+# (an ISO timestamp cannot match any financial or PHI rule), so a re-crawled page hits the cache.
+CACHE_EXCLUDE = risk_rules.SCORE_FIELDS | {"timestamp"}
+
+# Source files whose code computes a score row: the rules, the model features and the row
+# layout. Their hash is part of every key, so a deploy that changes how scores are computed
+# starts from an empty cache even when the rulebook and the model are unchanged.
+SCORE_CODE_SOURCES = [Path(risk_rules.__file__), Path(learning_service.__file__),
+                      Path(__file__).with_name("scoring_service.py")]
+
+def code_version(paths: Iterable[Path]) -> str:
+    digest = hashlib.blake2b(digest_size=6)
+    for path in paths:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+SCORE_CODE_VERSION = code_version(SCORE_CODE_SOURCES)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS scores_used ON scores (used);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# ===============================
+# Chapter 2: Cache Keys
+# ===============================
+def current_versions() -> Tuple[str, ...]:
+    """Developer Note: (scoring code, rulebook, model) versions; a change in any invalidates every cached score."""
+    return SCORE_CODE_VERSION, risk_rules.ENGINE.plan().version, learning_service.model_version() or "none"
+
+def event_key(event: Any, versions: Tuple[str, ...]) -> str:
+    """Developer Note: Content hash of everything the rules and the model read, salted with the versions."""
+    content = event.model_dump_json(exclude=CACHE_EXCLUDE)
+    return hashlib.blake2b("|".join((*versions, content)).encode(), digest_size=16).hexdigest()
+
+# ===============================
+# Chapter 3: SQLite Score Store
+# ===============================
+class ScoreCache:
+    """
+    Developer Note: key -> JSON score row in SQLite, evicted least-recently-used beyond max_rows.
+    The versions the rows were computed under live in `meta`; the first lookup under new
+    versions drops every row, so stale scores never linger until eviction.
+    """
+
+    def __init__(self, path: Path, max_rows: int = SCORE_CACHE_MAX_ROWS):
+        self.path = Path(path)
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _check_versions(self, versions: Tuple[str, ...]) -> None:
+        tag = "|".join(versions)
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'versions'").fetchone()
+        if row is None or row[0] != tag:
+            with self._conn:
+                self._conn.execute("DELETE FROM scores")
+                self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('versions', ?)", (tag,))
+
+    def get_many(self, keys: List[str], versions: Tuple[str, ...]) -> Dict[str, Dict[str, Any]]:
+        """Developer Note: Cached rows for the keys that are present; marks them as recently used."""
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            self._check_versions(versions)
+            unique = list(dict.fromkeys(keys))
+            for i in range(0, len(unique), 500):  # stay under SQLite's bound-parameter limit
+                batch = unique[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                for key, value in self._conn.execute(f"SELECT key, value FROM scores WHERE key IN ({marks})", batch):
+                    found[key] = json.loads(value)
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany("UPDATE scores SET used = ? WHERE key = ?", [(now, k) for k in found])
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, rows: Dict[str, Dict[str, Any]], versions: Tuple[str, ...]) -> None:
+        """Developer Note: Stores freshly computed rows, then trims the table to max_rows."""
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            self._check_versions(versions)
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO scores (key, value, used) VALUES (?, ?, ?)",
+                    [(k, json.dumps(v), now) for k, v in rows.items()],
+                )
+                excess = self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0] - self.max_rows
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY used LIMIT ?)", (excess,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_CACHE: Optional[ScoreCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def get_cache() -> Optional[ScoreCache]:
+    """Developer Note: Shared cache for SCORE_CACHE_PATH, or None when SCORE_CACHE_ENABLED is off."""
+    global _CACHE
+    if not SCORE_CACHE_ENABLED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None or _CACHE.path != Path(SCORE_CACHE_PATH):
+            if _CACHE is not None:
+                _CACHE.close()
+            _CACHE = ScoreCache(SCORE_CACHE_PATH, SCORE_CACHE_MAX_ROWS)
+        return _CACHE
@@ -2,19 +2,26 @@
 # Chapter 1: Imports and Setup
 # ===============================
 # This chapter sets up the environment and dependencies for data collection and event processing.
-import os, re, json, time
-from typing import List, Tuple
+import os, re, json, time, codecs, fcntl, shutil, logging, tempfile
+from contextlib import contextmanager, nullcontext as _nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import requests
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 from urllib.parse import urljoin, urlparse
 from models.events import SecurityEvent
 from pathlib import Path
+from app.services.risk_rules import StreamScanner
+
+logger = logging.getLogger("sea-sec")
 
 DATA_DIR = Path(os.getenv("DATA_DIR", "data")).resolve()
 EVENTS_PATH = DATA_DIR / "events.jsonl"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 DEFAULT_SITE = os.getenv("TARGET_SITE_URL", "https://mlbam-park.b12sites.com/").strip()
+FETCH_CHUNK_BYTES = 64 * 1024
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", str(5 * 1024 * 1024)))  # larger pages are truncated
 
 # ===============================
 # Chapter 2: Target Site Management
@@ -36,20 +43,86 @@ def set_target_site(url: str) -> str:
 # Chapter 3: Event Fetching and Parsing
 # ===============================
 def _fetch(url: str) -> Tuple[str, requests.Response]:
-    """Developer Note: Fetches a URL and returns the response."""
-    r = requests.get(url, timeout=15, headers={"User-Agent":"SEA-SEC/0.1"})
+    """Developer Note: Fetches a URL and returns the response (body not read yet; see _read_body)."""
+    r = requests.get(url, timeout=15, headers={"User-Agent":"SEA-SEC/0.1"}, stream=True)
     r.raise_for_status()
     return url, r
 
-def _event_from_response(url: str, r: requests.Response) -> SecurityEvent:
-    """Developer Note: Parses a response into a SecurityEvent object."""
+class _VisibleText(HTMLParser):
+    """
+    Developer Note: Incremental HTML parser that passes only the text a visitor would see to the
+    scanner: no tag names, attributes, comments or script/style bodies. Every tag boundary
+    becomes a space, so neighbouring cells cannot merge into one number.
+    """
+    HIDDEN = {"script", "style", "template"}
+
+    def __init__(self, scanner: StreamScanner):
+        super().__init__(convert_charrefs=True)
+        self.scanner = scanner
+        self.hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.HIDDEN:
+            self.hidden += 1
+        self.scanner.feed(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self.HIDDEN and self.hidden:
+            self.hidden -= 1
+        self.scanner.feed(" ")
+
+    def handle_data(self, data):
+        if not self.hidden:
+            self.scanner.feed(data)
+
+def _read_body(r: requests.Response) -> Tuple[str, Dict[str, int], List[str]]:
+    """
+    Developer Note: Streams the response body chunk by chunk through the sensitive-data scanner.
+    HTML goes through _VisibleText first, so only the page text is scanned, never the markup.
+    Returns (text, match counts per rule id, redacted snippets). Only the counts and snippets end
+    up on the event; the text is used for parsing and then dropped, so pages never need re-fetching.
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(r.encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    scanner = StreamScanner()
+    content_type = r.headers.get("content-type", "").lower()
+    sink = _VisibleText(scanner) if "html" in content_type or not content_type else scanner
+    parts: List[str] = []
+    read = 0
+    for raw in r.iter_content(chunk_size=FETCH_CHUNK_BYTES):
+        read += len(raw)
+        text = decoder.decode(raw)
+        sink.feed(text)
+        parts.append(text)
+        if read >= MAX_BODY_BYTES:
+            r.close()
+            break
+    tail = decoder.decode(b"", final=True)
+    sink.feed(tail)
+    if sink is not scanner:
+        sink.close()  # flushes text still buffered after the last tag
+    parts.append(tail)
+    counts, snippets = scanner.close()
+    return "".join(parts), counts, snippets
+
+def _parse_page(url: str, r: requests.Response) -> Tuple[SecurityEvent, BeautifulSoup]:
+    """Developer Note: Reads and scans the body once, then builds the event and returns the parsed soup."""
+    body, body_matches, body_snippets = _read_body(r)
     https = urlparse(url).scheme == "https"
-    soup = BeautifulSoup(r.text, "html.parser")
+    soup = BeautifulSoup(body, "html.parser")
     links = soup.find_all("a")
     forms = soup.find_all("form")
     has_login = any("password" in (inp.get("type","").lower()) for f in forms for inp in f.find_all("input"))
     headers = {k:str(v) for k,v in r.headers.items() if k.lower() in {"server","content-type","x-powered-by"}}
-    return SecurityEvent(page_url=url, https=https, num_links=len(links), num_forms=len(forms), has_login_form=has_login, headers=headers)
+    ev = SecurityEvent(page_url=url, https=https, num_links=len(links), num_forms=len(forms), has_login_form=has_login,
+                       headers=headers, body_matches=body_matches, body_snippets=body_snippets)
+    return ev, soup
+
+def _event_from_response(url: str, r: requests.Response) -> SecurityEvent:
+    """Developer Note: Parses a response into a SecurityEvent object."""
+    return _parse_page(url, r)[0]
 
 # ===============================
 # Chapter 4: Vulnerability Reports (Future)
@@ -69,7 +142,13 @@ def explotsreports():
 # ===============================
 # Chapter 5: Site Crawling
 # ===============================
-def crawl_site(max_pages: int = 15) -> List[SecurityEvent]:
+def crawl_site(max_pages: int = 15,
+               on_persist: Optional[Callable[[List[SecurityEvent]], None]] = None) -> List[SecurityEvent]:
+    """
+    Developer Note: Crawls the target site and appends the events to the store.
+    on_persist(events) runs right after the append, still under the store lock; the route uses it
+    for scoring_service.record_ingest.
+    """
     start = get_target_site()
     seen = set()
     to_visit = [start]
@@ -81,10 +160,9 @@ def crawl_site(max_pages: int = 15) -> List[SecurityEvent]:
         seen.add(url)
         try:
             _, resp = _fetch(url)
-            ev = _event_from_response(url, resp)
+            ev, soup = _parse_page(url, resp)
             events.append(ev)
             # enqueue new links on same host
-            soup = BeautifulSoup(resp.text, "html.parser")
             base = f"{urlparse(start).scheme}://{urlparse(start).netloc}"
             for a in soup.find_all("a", href=True):
                 nxt = urljoin(url, a["href"])
@@ -96,15 +174,51 @@ def crawl_site(max_pages: int = 15) -> List[SecurityEvent]:
                                         num_links=0, num_forms=0, has_login_form=False,
                                         headers={}, note=f"error: {type(e).__name__}: {e}"))
         time.sleep(0.3)
-    # persist
-    with open(EVENTS_PATH, "a") as f:
-        for ev in events:
-            f.write(ev.model_dump_json() + "\n")
+    # persist (under the store lock, so a concurrent rewrite carries these lines over)
+    with _store_lock():
+        with open(EVENTS_PATH, "a") as f:
+            for ev in events:
+                f.write(ev.model_dump_json() + "\n")
+        # still under the lock, so a rescore's recount lands either before or after this hook;
+        # the events are already stored, so a failing hook is logged and the crawl kept
+        if on_persist is not None:
+            try:
+                on_persist(events)
+            except Exception as e:
+                logger.warning(f"Ingest hook failed after persisting {len(events)} events: {type(e).__name__}: {e}")
+    # keep streaming feature stats current so drift can be checked without rescanning history
+    from app.services.drift_service import record_ingested
+    record_ingested(events)
     return events
 
 # ===============================
 # Chapter 6: Event Loading
 # ===============================
+# Two file locks (flock, so they hold across threads, workers and CLI processes):
+# the store lock guards appends and the final swap of a rewrite; the rewrite lock lets only
+# one rewrite run at a time, since each one replaces the whole file.
+@contextmanager
+def _flock(suffix: str):
+    lock_path = EVENTS_PATH.with_name(EVENTS_PATH.name + suffix)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _store_lock():
+    return _flock(".lock")
+
+def _rewrite_lock():
+    return _flock(".rewrite.lock")
+
+def store_size() -> int:
+    """Developer Note: Byte length of the event store; every line before it is complete."""
+    with _store_lock():
+        return EVENTS_PATH.stat().st_size if EVENTS_PATH.exists() else 0
+
 def load_events(limit: int = None) -> List[SecurityEvent]:
     events = []
     if not EVENTS_PATH.exists():
@@ -118,3 +232,91 @@ def load_events(limit: int = None) -> List[SecurityEvent]:
             if limit and len(events) >= limit:
                 break
     return events
+
+def _parse_lines(lines: Iterable[bytes]) -> List[SecurityEvent]:
+    events = []
+    for line in lines:
+        try:
+            events.append(SecurityEvent.model_validate_json(line))
+        except Exception:
+            continue
+    return events
+
+def iter_event_chunks(chunk_size: int = 1000, end: Optional[int] = None) -> Iterator[List[SecurityEvent]]:
+    """
+    Developer Note: Streams stored events in fixed-size chunks so the full history is never held in memory.
+    With `end` (see store_size) only lines starting before that byte offset are read.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if not EVENTS_PATH.exists():
+        return
+    chunk: List[SecurityEvent] = []
+    pos = 0
+    with open(EVENTS_PATH, "rb") as f:
+        for line in f:
+            if end is not None and pos >= end:
+                break
+            pos += len(line)
+            try:
+                chunk.append(SecurityEvent.model_validate_json(line))
+            except Exception:
+                continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def rewrite_events(chunks: Iterable[List[SecurityEvent]], source_end: Optional[int] = None,
+                   on_commit: Optional[Callable[[List[SecurityEvent]], None]] = None) -> Iterator[int]:
+    """
+    Developer Note: Writes updated events back to the event store chunk by chunk.
+    Output goes to a uniquely named temp file that replaces events.jsonl only once every chunk
+    is written, so an interrupted run leaves the store untouched. Yields the size of each written chunk.
+    `chunks` must cover the store up to byte `source_end`; lines appended after it (by ingest)
+    are copied over unchanged just before the swap, under the store lock. Without source_end
+    the store lock is held for the whole rewrite, so appends wait instead of being lost.
+    on_commit(carried-over events) runs right after the swap, still under the store lock.
+    Callers running next to other rewrites should use rewrite_store().
+    """
+    with tempfile.NamedTemporaryFile("w", dir=EVENTS_PATH.parent, prefix=EVENTS_PATH.name + ".",
+                                     suffix=".tmp", delete=False) as f:
+        tmp_path = Path(f.name)
+    try:
+        with (_store_lock() if source_end is None else _nullcontext()):
+            with open(tmp_path, "w") as f:
+                for chunk in chunks:
+                    f.writelines(ev.model_dump_json() + "\n" for ev in chunk)
+                    f.flush()
+                    yield len(chunk)
+            if source_end is None:
+                os.replace(tmp_path, EVENTS_PATH)
+                if on_commit is not None:
+                    on_commit([])
+                return
+        with _store_lock():
+            tail = b""
+            if EVENTS_PATH.exists():
+                with open(EVENTS_PATH, "rb") as src, open(tmp_path, "ab") as dst:
+                    src.seek(source_end)
+                    tail = src.read()  # only what ingest appended during this rewrite
+                    dst.write(tail)
+            os.replace(tmp_path, EVENTS_PATH)
+            if on_commit is not None:
+                on_commit(_parse_lines(tail.splitlines()))
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def rewrite_store(transform: Callable[[Iterable[List[SecurityEvent]]], Iterable[List[SecurityEvent]]],
+                  chunk_size: int = 1000,
+                  on_commit: Optional[Callable[[List[SecurityEvent]], None]] = None) -> Iterator[int]:
+    """
+    Developer Note: Runs every stored event through `transform` (e.g. learning_service.score_chunks)
+    and rewrites the store, one rewrite at a time. Ingest keeps appending meanwhile; those
+    events are carried over untouched and handed to on_commit. Yields the size of each written chunk.
+    """
+    with _rewrite_lock():
+        end = store_size()
+        yield from rewrite_events(transform(iter_event_chunks(chunk_size, end=end)), source_end=end,
+                                  on_commit=on_commit)
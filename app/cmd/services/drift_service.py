@@ -0,0 +1,161 @@
+# ===============================
+# Chapter 1: Imports and Setup
+# ===============================
+# This chapter sets up streaming feature statistics used to decide when the model needs retraining.
+import os, json, fcntl
+from contextlib import contextmanager
+from typing import Any, Dict, List
+import numpy as np
+
+from app.services.learning_service import DATA_DIR, FEATURES, _featurize, _load_model
+
+LIVE_STATS_PATH = DATA_DIR / "feature_stats.json"
+DRIFT_THRESHOLD = float(os.getenv("DRIFT_THRESHOLD", "0.2"))      # PSI above this => retrain
+MIN_DRIFT_SAMPLES = int(os.getenv("MIN_DRIFT_SAMPLES", "50"))      # ignore drift on tiny samples
+
+# Shared log-scale bins: binary features land in the first two, counts spread over the rest
+BIN_EDGES = np.array([0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, np.inf])
+
+# ===============================
+# Chapter 2: Streaming Feature Statistics
+# ===============================
+class FeatureStats:
+    """Developer Note: Per-feature count / mean / variance (Welford, merged batch-wise) plus a fixed-bin histogram."""
+
+    def __init__(self, count: int = 0, mean=None, m2=None, hist=None):
+        n = len(FEATURES)
+        self.count = count
+        self.mean = np.zeros(n) if mean is None else np.asarray(mean, dtype=float)
+        self.m2 = np.zeros(n) if m2 is None else np.asarray(m2, dtype=float)
+        self.hist = np.zeros((n, len(BIN_EDGES) - 1)) if hist is None else np.asarray(hist, dtype=float)
+
+    def update(self, X: np.ndarray) -> "FeatureStats":
+        """Developer Note: Folds a feature matrix into the running stats in O(rows) without keeping it."""
+        if len(X) == 0:
+            return self
+        n_b = len(X)
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        total = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * n_b / total
+        self.m2 = self.m2 + m2_b + delta ** 2 * self.count * n_b / total
+        self.count = total
+        for j in range(X.shape[1]):
+            self.hist[j] += np.histogram(X[:, j], bins=BIN_EDGES)[0]
+        return self
+
+    def subtract(self, part: "FeatureStats") -> "FeatureStats":
+        """Developer Note: Inverse of merging `part` in: the stats of the rows folded in after it."""
+        rest = self.count - part.count
+        if rest <= 0:
+            return FeatureStats()
+        mean = (self.mean * self.count - part.mean * part.count) / rest
+        delta = mean - part.mean
+        m2 = np.maximum(self.m2 - part.m2 - delta ** 2 * part.count * rest / self.count, 0)
+        return FeatureStats(rest, mean, m2, np.maximum(self.hist - part.hist, 0))
+
+    @property
+    def variance(self) -> np.ndarray:
+        return self.m2 / self.count if self.count else np.zeros_like(self.m2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "mean": self.mean.tolist(), "m2": self.m2.tolist(), "hist": self.hist.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FeatureStats":
+        return cls(data["count"], data["mean"], data["m2"], data["hist"])
+
+# ===============================
+# Chapter 3: Live Stats Persistence
+# ===============================
+def load_live_stats() -> FeatureStats:
+    """Developer Note: Stats for events ingested since the model was last trained."""
+    if not LIVE_STATS_PATH.exists():
+        return FeatureStats()
+    return FeatureStats.from_dict(json.loads(LIVE_STATS_PATH.read_text()))
+
+def _save_live_stats(stats: FeatureStats) -> None:
+    tmp_path = LIVE_STATS_PATH.with_name(LIVE_STATS_PATH.name + ".tmp")
+    tmp_path.write_text(json.dumps(stats.to_dict()))
+    os.replace(tmp_path, LIVE_STATS_PATH)
+
+@contextmanager
+def _live_lock():
+    # flock, not a threading.Lock: training resets the stats from a CPU worker process while
+    # API workers record ingests
+    lock_path = LIVE_STATS_PATH.with_name(LIVE_STATS_PATH.name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def record_ingested(events: List[Any]) -> FeatureStats:
+    """Developer Note: Called on ingest; merges the new events into the live stats file."""
+    with _live_lock():
+        stats = load_live_stats().update(_featurize(events))
+        _save_live_stats(stats)
+        return stats
+
+def snapshot_live_stats() -> FeatureStats:
+    """Developer Note: Live stats as a training run starts; take it before the run loads its events."""
+    with _live_lock():
+        return load_live_stats()
+
+def consume_live_stats(started_from: FeatureStats) -> None:
+    """
+    Developer Note: Called after training. Removes the stats the run started from instead of
+    zeroing the file, so ingests recorded while the model was fitting stay counted as live.
+    """
+    with _live_lock():
+        _save_live_stats(load_live_stats().subtract(started_from))
+
+# ===============================
+# Chapter 4: Drift Scoring
+# ===============================
+def _psi(expected: np.ndarray, actual: np.ndarray, eps: float = 1e-4) -> float:
+    """Developer Note: Population stability index between two histograms (0 = identical)."""
+    p = expected / max(expected.sum(), 1) + eps
+    q = actual / max(actual.sum(), 1) + eps
+    return float(((q - p) * np.log(q / p)).sum())
+
+def drift_report() -> Dict[str, Any]:
+    """
+    Developer Note: Compares live ingest stats with the baseline stored alongside the model.
+    retrain_recommended is True when there is no usable baseline, or when enough new events
+    have arrived and the worst feature's PSI crosses DRIFT_THRESHOLD.
+    """
+    live = load_live_stats()
+    try:
+        baseline_dict = _load_model().get("feature_stats")
+    except FileNotFoundError:
+        baseline_dict = None
+    if baseline_dict is None:
+        return {"drift_score": None, "retrain_recommended": True, "reason": "no trained model with feature stats",
+                "live_count": live.count, "threshold": DRIFT_THRESHOLD, "features": {}}
+
+    baseline = FeatureStats.from_dict(baseline_dict)
+    features = {}
+    for j, name in enumerate(FEATURES):
+        std = float(np.sqrt(baseline.variance[j])) or 1.0
+        features[name] = {
+            "psi": round(_psi(baseline.hist[j], live.hist[j]), 4) if live.count else 0.0,
+            "baseline_mean": float(baseline.mean[j]),
+            "live_mean": float(live.mean[j]) if live.count else None,
+            "mean_shift_std": round(abs(float(live.mean[j] - baseline.mean[j])) / std, 4) if live.count else 0.0,
+        }
+    drift_score = max(f["psi"] for f in features.values())
+    enough = live.count >= MIN_DRIFT_SAMPLES
+    return {
+        "drift_score": drift_score,
+        "retrain_recommended": bool(enough and drift_score >= DRIFT_THRESHOLD),
+        "reason": "drift above threshold" if enough and drift_score >= DRIFT_THRESHOLD
+                  else ("not enough new events" if not enough else "within threshold"),
+        "live_count": live.count,
+        "baseline_count": baseline.count,
+        "threshold": DRIFT_THRESHOLD,
+        "features": features,
+    }
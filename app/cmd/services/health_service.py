@@ -0,0 +1,107 @@
+# ===============================
+# Chapter 1: Imports and Setup
+# ===============================
+# This chapter sets up the cached state behind the liveness / readiness probes. Anything that
+# touches the file system is checked by refresh() on a timer; the probes only read memory.
+import os, asyncio, logging, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from app.services import data_service, learning_service
+from app.services.reporting_service import REPORT_DIR
+from app.utils.executors import executor_stats
+
+HEALTH_REFRESH_SECONDS = float(os.getenv("HEALTH_REFRESH_SECONDS", "15"))
+# Checks older than this many refresh intervals count as unknown, so a stuck refresher fails readiness
+HEALTH_STALE_INTERVALS = 3
+# A fresh deployment has no model until /learn/train runs; set to 1 to keep it out of rotation until then
+READY_REQUIRES_MODEL = os.getenv("READY_REQUIRES_MODEL", "0") == "1"
+logger = logging.getLogger("sea-sec")
+
+STATE: Dict[str, Any] = {"checked_at": None, "target_site": None, "checks": {}}
+_TASK: Optional[asyncio.Task] = None
+# Its own thread: a busy IO pool must not starve the checks (or make a healthy worker look stale)
+_REFRESHER: Optional[ThreadPoolExecutor] = None
+
+# ===============================
+# Chapter 2: Background File-System Checks
+# ===============================
+def _check_dir(path) -> Dict[str, Any]:
+    ok = path.is_dir() and os.access(path, os.R_OK | os.W_OK)
+    return {"ok": ok, "path": str(path)} if ok else {"ok": False, "path": str(path), "error": "missing or not writable"}
+
+def refresh() -> Dict[str, Any]:
+    """Developer Note: Runs every check that needs the disk and stores the results in STATE."""
+    events = data_service.EVENTS_PATH
+    event_store = _check_dir(events.parent)
+    if event_store["ok"] and events.exists() and not os.access(events, os.R_OK):
+        event_store = {"ok": False, "path": str(events), "error": "not readable"}
+    STATE["checks"] = {
+        "event_store": event_store,
+        "reports_dir": _check_dir(REPORT_DIR),
+        # Loads a newly trained artifact into this worker; a stat() when nothing changed
+        "model_file": {"ok": learning_service.model_version() is not None, "path": str(learning_service.MODEL_PATH)},
+    }
+    STATE["target_site"] = data_service.get_target_site()
+    STATE["checked_at"] = time.time()
+    return STATE
+
+def remember_target_site(url: str) -> None:
+    """Developer Note: Lets /set_site update the cached value without waiting for the next refresh."""
+    STATE["target_site"] = url
+
+async def _refresh_forever(refresher: ThreadPoolExecutor) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(HEALTH_REFRESH_SECONDS)
+        try:
+            # a hung disk blocks only this thread; the results go stale (and unready) meanwhile
+            await loop.run_in_executor(refresher, refresh)
+        except Exception as e:
+            logger.warning(f"Health refresh failed: {e}")
+
+def start() -> None:
+    """Developer Note: Call from the app startup hook: one synchronous refresh, then a background loop."""
+    global _TASK, _REFRESHER
+    refresh()
+    if _REFRESHER is None:
+        _REFRESHER = ThreadPoolExecutor(1, thread_name_prefix="sea-health")
+    if _TASK is None or _TASK.done():
+        _TASK = asyncio.get_running_loop().create_task(_refresh_forever(_REFRESHER))
+
+def stop() -> None:
+    global _TASK, _REFRESHER
+    if _TASK is not None:
+        _TASK.cancel()
+        _TASK = None
+    if _REFRESHER is not None:
+        _REFRESHER.shutdown(wait=False, cancel_futures=True)
+        _REFRESHER = None
+
+# ===============================
+# Chapter 3: Probes
+# ===============================
+def liveness() -> Dict[str, Any]:
+    """Developer Note: The process is up and its event loop answers; nothing else is consulted."""
+    return {"status": "ok"}
+
+def readiness() -> Dict[str, Any]:
+    """
+    Developer Note: Ready when the cached file-system checks are fresh and passing, the model is
+    loaded (required only with READY_REQUIRES_MODEL=1) and neither executor is saturated.
+    Reads memory only: the disk is left to refresh().
+    """
+    checked_at = STATE["checked_at"]
+    fresh = checked_at is not None and time.time() - checked_at <= HEALTH_STALE_INTERVALS * HEALTH_REFRESH_SECONDS
+    queues = executor_stats()
+    checks = {
+        "fresh": {"ok": fresh, "age_seconds": None if checked_at is None else round(time.time() - checked_at, 1)},
+        "event_store": STATE["checks"].get("event_store", {"ok": False}),
+        "reports_dir": STATE["checks"].get("reports_dir", {"ok": False}),
+        "model": {"ok": learning_service.model_loaded(), "required": READY_REQUIRES_MODEL,
+                  "file": STATE["checks"].get("model_file", {}).get("ok", False)},
+        "queues": {"ok": all(q["pending"] < q["workers"] + q["queue_depth"] for q in queues.values()), **queues},
+    }
+    ready = all(check["ok"] for name, check in checks.items() if name != "model") and (
+        checks["model"]["ok"] or not READY_REQUIRES_MODEL)
+    return {"status": "ready" if ready else "unready", "checks": checks}
@@ -2,11 +2,12 @@
 # Chapter 1: Imports and Setup
 # ===============================
 # This chapter sets up the environment and dependencies for ML anomaly detection.
-import os, joblib
-from typing import List
+import os, joblib, threading, time, uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 import numpy as np
 from pathlib import Path
 from models.events import SecurityEvent, TrainResult
+from app.services.data_service import load_events
 
 from sklearn.ensemble import IsolationForest
 
@@ -16,6 +17,15 @@ MODEL_DIR.mkdir(parents=True, exist_ok=True)
 MODEL_PATH = MODEL_DIR / "isoforest.pkl"
 
 FEATURES = ["https","num_links","num_forms","has_login_form"]  # simple demo features
+SCORE_CHUNK_SIZE = int(os.getenv("SCORE_CHUNK_SIZE", "5000"))
+CALIBRATION_POINTS = 101  # quantiles of training scores stored with the model
+
+# Loaded artifact, shared by every request in this worker. Arrays are memory-mapped
+# read-only so workers on the same host share them through the page cache (sklearn
+# still copies tree node arrays on unpickle; everything else stays mapped).
+_MODEL_CACHE: Dict[str, Any] = {}
+_MODEL_LOCK = threading.Lock()
+MODEL_STATS: Dict[str, Any] = {"load_seconds": None, "warmup_seconds": None, "first_request_seconds": None}
 
 # ===============================
 # Chapter 2: Feature Engineering
@@ -35,31 +45,141 @@ def _featurize(events: List[SecurityEvent]) -> np.ndarray:
 # ===============================
 # Chapter 3: Model Training
 # ===============================
-def train(events: List[SecurityEvent]) -> TrainResult:
-    """Developer Note: Trains an IsolationForest model on event data."""
+def train(events: List[SecurityEvent], live_stats=None) -> TrainResult:
+    """
+    Developer Note: Trains an IsolationForest model on event data.
+    `live_stats` is drift_service.snapshot_live_stats() taken before `events` were loaded; only
+    that much is consumed from the live stats afterwards (taken here when not given).
+    """
+    from app.services.drift_service import FeatureStats, consume_live_stats, snapshot_live_stats
+    if live_stats is None:
+        live_stats = snapshot_live_stats()
     if not events:
         raise ValueError("No events to train on.")
     X = _featurize(events)
     clf = IsolationForest(n_estimators=100, contamination="auto", random_state=42)
     clf.fit(X)
+    # Quantile sketch of training scores: lets score() map any single event to risk
+    # without ranking it against the rest of its batch.
+    calibration = np.quantile(clf.decision_function(X), np.linspace(0, 1, CALIBRATION_POINTS))
+    # Baseline feature stats: drift_service compares newly ingested events against these
+    feature_stats = FeatureStats().update(X).to_dict()
     import joblib as _joblib
-    _joblib.dump(clf, MODEL_PATH)
+    # Uncompressed so joblib can mmap the arrays on load; written aside and swapped in
+    # because other workers may have the current file mapped.
+    tmp_path = MODEL_PATH.with_name(MODEL_PATH.name + ".tmp")
+    artifact = {"model": clf, "calibration": calibration, "feature_stats": feature_stats, "version": uuid.uuid4().hex[:12]}
+    _joblib.dump(artifact, tmp_path, compress=0)
+    os.replace(tmp_path, MODEL_PATH)
+    consume_live_stats(live_stats)
     return TrainResult(trained_on=len(events), model_path=str(MODEL_PATH))
 
+def train_from_store() -> TrainResult:
+    """
+    Developer Note: Trains on the whole event store. This is the /learn/train job: it runs in a
+    CPU worker process and loads the events there, so they are never pickled across processes.
+    """
+    from app.services.drift_service import snapshot_live_stats
+    live_stats = snapshot_live_stats()  # before loading: whatever it counts is in the events
+    return train(load_events(), live_stats)
+
 # ===============================
 # Chapter 4: Model Scoring
 # ===============================
-def score(events: List[SecurityEvent]) -> np.ndarray:
-    """Developer Note: Scores events for anomaly risk using the trained model."""
+def _load_model() -> dict:
+    """
+    Developer Note: Returns the trained artifact from MODEL_PATH as {"model", "calibration", "version"}.
+    The artifact is loaded with mmap_mode="r" and cached until the file changes on disk.
+    Artifacts saved before calibration existed hold a bare IsolationForest; they load with
+    calibration=None and fall back to batch ranking until the model is retrained; older
+    artifacts without a version get one derived from the file's mtime and size.
+    """
     import joblib as _joblib
-    if not MODEL_PATH.exists():
+    try:
+        st = MODEL_PATH.stat()
+    except FileNotFoundError:
         raise FileNotFoundError("Model not found; train first.")
-    clf: IsolationForest = _joblib.load(MODEL_PATH)
-    X = _featurize(events)
+    key = (str(MODEL_PATH), st.st_ino, st.st_mtime_ns, st.st_size)
+    with _MODEL_LOCK:
+        if _MODEL_CACHE.get("key") == key:
+            return _MODEL_CACHE["artifact"]
+        started = time.perf_counter()
+        artifact = _joblib.load(MODEL_PATH, mmap_mode="r")
+        if isinstance(artifact, IsolationForest):
+            artifact = {"model": artifact, "calibration": None}
+        artifact.setdefault("version", f"{st.st_mtime_ns:x}-{st.st_size:x}")
+        MODEL_STATS["load_seconds"] = time.perf_counter() - started
+        _MODEL_CACHE["key"] = key
+        _MODEL_CACHE["artifact"] = artifact
+        return artifact
+
+def model_version() -> Optional[str]:
+    """Developer Note: Id of the trained artifact (new on every train), or None when no model exists."""
+    try:
+        return _load_model()["version"]
+    except FileNotFoundError:
+        return None
+
+def model_loaded() -> bool:
+    """Developer Note: True when an artifact is already cached in this worker."""
+    return "artifact" in _MODEL_CACHE
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Developer Note: Loads the model and scores one dummy row so the first real request
+    does not pay for unpickling or sklearn's lazy setup. Call from the app startup hook.
+    """
+    artifact = _load_model()
+    started = time.perf_counter()
+    artifact["model"].decision_function(np.zeros((1, len(FEATURES))))
+    MODEL_STATS["warmup_seconds"] = time.perf_counter() - started
+    return dict(MODEL_STATS)
+
+def _risk_from_raw(raw: np.ndarray, calibration: np.ndarray = None) -> np.ndarray:
+    """
+    Developer Note: Maps decision_function output to 0..1 risk (1 = riskiest).
+    With a calibration sketch each event is placed on the training-score CDF independently
+    (a binary search over CALIBRATION_POINTS values), so risk is stable across batches.
+    """
+    if calibration is not None:
+        cdf = np.interp(raw, calibration, np.linspace(0, 1, len(calibration)))
+        return 1 - cdf
     # Lower scores => more anomalous; convert to 0..1 risk via rank
-    raw = clf.decision_function(X)  # higher is more normal
     order = raw.argsort()
     ranks = np.empty_like(order, dtype=float)
     ranks[order] = np.linspace(0,1,len(raw))
-    risk = 1 - ranks  # 1 = riskiest
+    return 1 - ranks
+
+def score(events: List[SecurityEvent]) -> np.ndarray:
+    """Developer Note: Scores events for anomaly risk using the trained model."""
+    started = time.perf_counter()
+    artifact = _load_model()
+    X = _featurize(events)
+    raw = artifact["model"].decision_function(X)  # higher is more normal
+    risk = _risk_from_raw(raw, artifact["calibration"])
+    if MODEL_STATS["first_request_seconds"] is None:
+        MODEL_STATS["first_request_seconds"] = time.perf_counter() - started
     return risk
+
+# ===============================
+# Chapter 5: Streaming Batch Scoring
+# ===============================
+def score_chunks(chunks: Iterable[List[SecurityEvent]]) -> Iterator[List[SecurityEvent]]:
+    """
+    Developer Note: Scores event chunks one at a time and sets `anomaly_score` on each event.
+    The model is loaded once up front (so a missing model fails before any chunk is read);
+    only the current chunk's feature matrix is ever in memory.
+    """
+    artifact = _load_model()
+    clf, calibration = artifact["model"], artifact["calibration"]
+
+    def _scored() -> Iterator[List[SecurityEvent]]:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            risk = _risk_from_raw(clf.decision_function(_featurize(chunk)), calibration)
+            for ev, r in zip(chunk, risk):
+                ev.anomaly_score = float(r)
+            yield chunk
+
+    return _scored()
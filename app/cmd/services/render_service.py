@@ -0,0 +1,166 @@
+# ===============================
+# Chapter 1: Imports and Setup
+# ===============================
+# This chapter sets up PDF / PNG snapshots of the report, rendered off the request path by a
+# small worker pool and cached under the sha256 of the HTML they were rendered from. The source
+# is the whole report with every record (reporting_service.print_html), not the report.html index.
+import os, atexit, hashlib, logging, multiprocessing, threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.reporting_service import REPORT_DIR, current_report_id, print_html
+
+try:
+    from weasyprint import HTML
+except ImportError:
+    HTML = None
+
+RENDER_DIR = REPORT_DIR / "renders"
+RENDER_FORMATS = ["pdf", "png"]
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+RENDER_CACHE_KEEP = int(os.getenv("RENDER_CACHE_KEEP", "20"))   # snapshots kept per format
+logger = logging.getLogger("sea-sec")
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_JOBS: Dict[Tuple[str, str], Future] = {}
+_LOCK = threading.Lock()
+# report id -> sha256 of its print HTML, so polling a snapshot does not rebuild the document
+_SOURCE_DIGESTS: Dict[str, str] = {}
+
+def available() -> bool:
+    return HTML is not None
+
+def can_render(fmt: str) -> bool:
+    """Developer Note: weasyprint 53+ dropped write_png, so PNG depends on the installed version."""
+    return HTML is not None and hasattr(HTML, f"write_{fmt}")
+
+def render_path(digest: str, fmt: str) -> Path:
+    return RENDER_DIR / f"{digest}.{fmt}"
+
+# ===============================
+# Chapter 2: Worker Pool
+# ===============================
+def _render(html: str, base_url: str, fmt: str, target: str) -> str:
+    """Developer Note: Runs in a worker process; writes next to `target` and swaps it in when complete."""
+    if HTML is None:
+        raise ImportError("weasyprint not installed. Run `pip install weasyprint`.")
+    document = HTML(string=html, base_url=base_url)
+    writer = getattr(document, f"write_{fmt}", None)
+    if writer is None:  # submit() checks can_render(); kept for a weasyprint swapped under a running pool
+        raise RuntimeError(f"This weasyprint version cannot write {fmt.upper()}.")
+    tmp_path = target + ".tmp"
+    writer(tmp_path)
+    os.replace(tmp_path, target)
+    return target
+
+def _get_pool() -> ProcessPoolExecutor:
+    # spawn, not fork: the API process runs threads, and forking those is not safe
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _POOL
+
+def shutdown_pool() -> None:
+    global _POOL
+    with _LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(cancel_futures=True)
+            _POOL = None
+        _JOBS.clear()
+
+atexit.register(shutdown_pool)
+
+# ===============================
+# Chapter 3: Snapshot Jobs
+# ===============================
+def _prune(fmt: str) -> None:
+    snapshots = sorted(RENDER_DIR.glob(f"*.{fmt}"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in snapshots[RENDER_CACHE_KEEP:]:
+        old.unlink(missing_ok=True)
+
+def _status(digest: str, fmt: str) -> Dict[str, Any]:
+    # caller holds _LOCK
+    if render_path(digest, fmt).exists():
+        return {"status": "ready", "path": str(render_path(digest, fmt))}
+    job = _JOBS.get((digest, fmt))
+    if job is not None and not job.done():
+        return {"status": "rendering"}
+    if job is None or job.cancelled() or job.exception() is None:
+        _JOBS.pop((digest, fmt), None)  # finished jobs only matter while they hold an error
+        return {"status": "missing"}
+    return {"status": "failed", "error": str(job.exception())}
+
+def _on_done(fmt: str, job: Future) -> None:
+    if job.cancelled():
+        return
+    if job.exception() is not None:
+        logger.warning(f"Report {fmt.upper()} rendering failed: {job.exception()}")
+    else:
+        _prune(fmt)
+
+def _build_source() -> Tuple[bytes, str]:
+    report_id, text = print_html()
+    html = text.encode("utf-8")
+    digest = hashlib.sha256(html).hexdigest()
+    _SOURCE_DIGESTS.clear()  # only the current report is ever asked for
+    _SOURCE_DIGESTS[report_id] = digest
+    return html, digest
+
+def submit(html_path: Path = None, formats=None) -> Dict[str, Dict[str, Any]]:
+    """
+    Developer Note: Queues a snapshot of the report HTML in each format unless one for the same
+    content is cached or already rendering; returns {fmt: status}. A failed render is not retried
+    for the same content (the error is reported instead), so a broken page cannot spin the pool.
+    Formats the installed weasyprint cannot write are never queued: without `formats` they are
+    skipped, and an explicit request gets "unsupported".
+    The HTML is built or read once here, so a report regenerated mid-render cannot mix into the
+    snapshot. Without `html_path` the source is the current report (print_html); before the first
+    report it falls back to the sample report.html.
+    """
+    html: Optional[bytes] = None
+    report_id = None
+    if html_path is None:
+        try:
+            report_id = current_report_id()
+        except FileNotFoundError:
+            html_path = REPORT_DIR / "report.html"
+    if html_path is not None:
+        html = html_path.read_bytes()
+        digest = hashlib.sha256(html).hexdigest()
+        base_url = str(html_path.parent.resolve()) + os.sep
+    else:
+        base_url = str(REPORT_DIR.resolve()) + os.sep
+        digest = _SOURCE_DIGESTS.get(report_id)
+        if digest is None:
+            html, digest = _build_source()
+    statuses = {}
+    with _LOCK:
+        for fmt in formats or [fmt for fmt in RENDER_FORMATS if can_render(fmt)]:
+            status = _status(digest, fmt)
+            if status["status"] == "missing" and available() and not can_render(fmt):
+                status = {"status": "unsupported"}
+            elif status["status"] == "missing" and available():
+                if html is None:  # digest known, but this format still has to be rendered
+                    html, digest = _build_source()
+                RENDER_DIR.mkdir(parents=True, exist_ok=True)
+                job = _get_pool().submit(_render, html.decode("utf-8"), base_url, fmt, str(render_path(digest, fmt)))
+                job.add_done_callback(lambda j, fmt=fmt: _on_done(fmt, j))
+                _JOBS[(digest, fmt)] = job
+                status = {"status": "rendering"}
+            statuses[fmt] = {"digest": digest, **status}
+    return statuses
+
+def snapshot(fmt: str, html_path: Path = None) -> Dict[str, Any]:
+    """
+    Developer Note: Status of the snapshot for the current report, queueing it if needed.
+    "ready" carries the file path; "rendering" means try again shortly; "failed" carries the error.
+    Raises ImportError when weasyprint is missing and nothing is cached, NotImplementedError when
+    the installed weasyprint cannot write `fmt`.
+    """
+    status = submit(html_path, [fmt])[fmt]
+    if status["status"] == "missing":
+        raise ImportError("weasyprint not installed. Run `pip install weasyprint`.")
+    if status["status"] == "unsupported":
+        raise NotImplementedError(f"The installed weasyprint cannot write {fmt.upper()} (dropped in weasyprint 53).")
+    return status
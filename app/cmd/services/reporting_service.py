@@ -1,16 +1,85 @@
 # ===============================
 # Chapter 3: Main Report Generation
 # ===============================
-from doctest import REPORT_UDIFF
+import csv
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlsplit
 from click import echo
-from jinja2 import Template
-from typing import Any, Dict, List
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 from pathlib import Path
 
 # Define the directory where reports will be saved
 REPORT_DIR = Path("reports")
 REPORT_DIR.mkdir(exist_ok=True)
 
+# Templates are compiled once per process and kept in env's cache; compiled bytecode is also
+# written to TEMPLATE_CACHE_DIR so a fresh worker skips parsing too. Set TEMPLATE_AUTO_RELOAD=0
+# in production so a cached template is served without stat'ing its source on every render.
+TEMPLATE_DIR = Path(os.getenv("TEMPLATE_DIR", "templates"))
+TEMPLATE_CACHE_DIR = Path(os.getenv("TEMPLATE_CACHE_DIR", "data/jinja_cache"))
+TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+REPORT_TEMPLATE = "templates/report.html.j2"          # one page of the event table
+INDEX_TEMPLATE = "templates/report_index.html.j2"      # report.html: aggregate counts + page links
+DELTA_TEMPLATE = "templates/report_delta.html.j2"      # delta/delta.html: what changed since a base run
+PRINT_TEMPLATE = "templates/report_print.html.j2"      # every record in one document, for PDF / PNG
+
+# HTML is split into pages of REPORT_PAGE_SIZE rows: "all" pages in event order, plus one
+# page series per risk level, under REPORT_DIR/pages. report.html itself is the small index.
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", "500"))
+PAGE_DIR = "pages"
+PAGE_SHARDS = ["all", "high", "medium", "low"]
+INDEX_TOP_HOSTS = 20
+
+# Rollup aggregates (counts by risk level, business impact, host and day) are updated as each
+# record is written and saved next to the report, so summaries never re-read the events.
+ROLLUP_FILE = "rollup.json"
+# Whole-store counts (ingest and rescoring keep them current); never mixed into a report's rollup
+STORE_ROLLUP_FILE = "store_rollup.json"
+ROLLUP_DIMENSIONS = ["risk_level", "business_impact", "host", "day"]
+
+# Records are also kept as compact NDJSON, one file per page shard under REPORT_DIR/events,
+# for /report/events: a cursor is a byte offset into one shard, so any page costs one seek.
+EVENT_DIR = "events"
+EVENT_REPORT_ID_FILE = "report_id"   # which report the shards belong to; cursors are checked against it
+EVENTS_PAGE_LIMIT = int(os.getenv("EVENTS_PAGE_LIMIT", "500"))
+
+# Every output file can get a precompressed .gz sibling written in the same pass, so the
+# download routes can send it as-is to clients that accept gzip.
+REPORT_GZIP = os.getenv("REPORT_GZIP", "1") == "1"
+REPORT_GZIP_LEVEL = int(os.getenv("REPORT_GZIP_LEVEL", "6"))
+FANOUT_BATCH = 256   # records handed to the writer threads at a time
+FANOUT_DEPTH = 8     # batches queued per writer before the scoring side waits
+OUT_BUFFER_BYTES = 64 * 1024
+
+env = Environment(
+    loader=FileSystemLoader(str(TEMPLATE_DIR)),
+    bytecode_cache=FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR)),
+    auto_reload=os.getenv("TEMPLATE_AUTO_RELOAD", "1") == "1",
+    autoescape=select_autoescape(["html", "html.j2"]),
+)
+
+def warm_templates() -> float:
+    """Developer Note: Compiles the report templates ahead of the first request; returns seconds taken."""
+    started = time.perf_counter()
+    env.get_template(REPORT_TEMPLATE)
+    env.get_template(INDEX_TEMPLATE)
+    env.get_template(DELTA_TEMPLATE)
+    env.get_template(PRINT_TEMPLATE)
+    return time.perf_counter() - started
+
 def _get_risk_reason(event, risk):
     """
     Returns a tuple of (reason, description) for a given event and risk score.
@@ -27,113 +96,695 @@ def _get_risk_reason(event, risk):
     return reason, description
 
 
-def generate(events: List[Any], risks: List[Dict[str, Any]]) -> Dict[str, Any]:
+# Column order shared by the CSV header, the HTML table and every JSON record
+REPORT_FIELDS = [
+    "timestamp", "page_url", "https", "num_links", "num_forms", "has_login_form",
+    "pattern", "risk", "risk_level", "business_impact", "risk_reason", "description",
+]
+REPORT_JSON_FORMAT = os.getenv("REPORT_JSON_FORMAT", "array")  # "array" (report.json) or "ndjson" (report.ndjson)
+
+def _enrich(r: Dict[str, Any]) -> Dict[str, Any]:
+    """Developer Note: Turns one scored row into a report record (tier, business impact, reason)."""
+    event = r["event"]
+    risk = r["risk"]
+    pattern = r.get("pattern", "N/A")
+
+    # Determine reason + description
+    reason, description = _get_risk_reason(event, risk)
+
+    # Assign tier + business impact mapping
+    if risk >= 7:
+        risk_level = "High"
+        business_impact = "Critical Business Impact"
+    elif risk >= 4:
+        risk_level = "Medium"
+        business_impact = "Moderate Business Impact"
+    else:
+        risk_level = "Low"
+        business_impact = "Minimal Business Impact"
+
+    return {
+        "timestamp": str(getattr(event, "timestamp", None)),
+        "page_url": getattr(event, "page_url", None),
+        "https": getattr(event, "https", None),
+        "num_links": getattr(event, "num_links", None),
+        "num_forms": getattr(event, "num_forms", None),
+        "has_login_form": getattr(event, "has_login_form", None),
+        "pattern": pattern,
+        "risk": risk,
+        "risk_level": risk_level,
+        "business_impact": business_impact,
+        "risk_reason": reason,
+        "description": description,
+    }
+
+class _JsonWriter:
+    """Developer Note: Writes records one at a time as a JSON array (same layout as json.dump(indent=2)) or NDJSON."""
+
+    def __init__(self, f, ndjson: bool):
+        self.f, self.ndjson, self.count = f, ndjson, 0
+        if not ndjson:
+            f.write("[")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.ndjson:
+            self.f.write(json.dumps(record, default=str) + "\n")
+        else:
+            body = json.dumps(record, indent=2, default=str).replace("\n", "\n  ")
+            self.f.write(("," if self.count else "") + "\n  " + body)
+        self.count += 1
+
+    def close(self) -> None:
+        if not self.ndjson:
+            self.f.write("\n]" if self.count else "]")
+
+class _EventShardWriter:
+    """
+    Developer Note: Appends each record as one NDJSON line to the "all" shard and to its risk level's
+    shard. The report id is written next to the shards, so it is swapped in together with them.
+    """
+
+    def __init__(self, directory: Path, report_id: str):
+        directory.mkdir(parents=True)
+        (directory / EVENT_REPORT_ID_FILE).write_text(report_id)
+        self.files = {shard: open(directory / f"{shard}.ndjson", "w", encoding="utf-8", newline="\n",
+                                  buffering=OUT_BUFFER_BYTES) for shard in PAGE_SHARDS}
+
+    def add(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str, separators=(",", ":")) + "\n"
+        self.files["all"].write(line)
+        self.files[record["risk_level"].lower()].write(line)
+
+    def close(self) -> None:
+        for f in self.files.values():
+            f.close()
+
+class _PagedHtmlWriter:
+    """
+    Developer Note: Buffers at most one page of rows per shard and renders it when full, so memory
+    is bounded by REPORT_PAGE_SIZE x shards. A page is flushed only once the next row arrives,
+    which is how it knows whether to link to a following page.
+    """
+
+    def __init__(self, directory: Path, page_size: int, gz: bool = False):
+        self.directory = directory
+        self.page_size = max(page_size, 1)
+        self.gz = gz
+        self.template = env.get_template(REPORT_TEMPLATE)
+        self.buffers: Dict[str, List[Dict[str, Any]]] = {shard: [] for shard in PAGE_SHARDS}
+        self.pages: Dict[str, int] = {shard: 0 for shard in PAGE_SHARDS}
+        directory.mkdir(parents=True)
+
+    def add(self, record: Dict[str, Any]) -> None:
+        for shard in ("all", record["risk_level"].lower()):
+            if len(self.buffers[shard]) == self.page_size:
+                self._flush(shard, has_next=True)
+            self.buffers[shard].append(record)
+
+    def close(self) -> Dict[str, int]:
+        for shard in PAGE_SHARDS:
+            if self.buffers[shard] or (shard == "all" and not self.pages[shard]):
+                self._flush(shard, has_next=False)
+        return dict(self.pages)
+
+    def _flush(self, shard: str, has_next: bool) -> None:
+        self.pages[shard] += 1
+        page = self.pages[shard]
+        out = _TextOut(self.directory / _page_name(shard, page), self.gz)
+        try:
+            for chunk in self.template.generate(records=self.buffers[shard], columns=REPORT_FIELDS,
+                                                shard=shard, page=page, has_next=has_next):
+                out.write(chunk)
+            out.commit()
+        except BaseException:
+            out.abort()
+            raise
+        self.buffers[shard].clear()
+
+def _page_name(shard: str, page: int) -> str:
+    return f"{shard}-{page:04d}.html"
+
+def report_page_path(shard: str = "all", page: int = 1) -> Path:
+    """Developer Note: File holding page `page` (1-based) of a shard: "all" or a risk level."""
+    return REPORT_DIR / PAGE_DIR / _page_name(shard, page)
+
+def _host(page_url: Any) -> str:
+    return urlsplit(str(page_url)).hostname or "unknown"
+
+def _tmp(path: Path) -> Path:
+    return path.with_name(path.name + ".tmp")
+
+def gz_path(path: Path) -> Path:
+    """Developer Note: Precompressed sibling of a report file (report.csv -> report.csv.gz)."""
+    return path.with_name(path.name + ".gz")
+
+class _TextOut:
+    """
+    Developer Note: One report file written to a .tmp name, plus its .gz sibling when gz is on.
+    Writes are buffered and encoded once per OUT_BUFFER_BYTES block, so gzip sees large blocks
+    instead of one tiny compress call per cell. commit() swaps the files in (and drops a stale
+    .gz when gz is off); abort() throws away whatever was not committed. Text is written
+    as-is (no newline translation), which is what the csv module expects.
+    """
+
+    def __init__(self, path: Path, gz: bool):
+        self.path, self.gz = path, gz
+        self.buffer: List[str] = []
+        self.buffered = 0
+        self.files = [open(_tmp(path), "wb")]
+        if gz:
+            self.files.append(gzip.open(_tmp(gz_path(path)), "wb", compresslevel=REPORT_GZIP_LEVEL))
+
+    def write(self, text: str) -> None:
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= OUT_BUFFER_BYTES:
+            self._drain()
+
+    def _drain(self) -> None:
+        data = "".join(self.buffer).encode("utf-8")
+        self.buffer, self.buffered = [], 0
+        for f in self.files:
+            f.write(data)
+
+    def _close(self) -> None:
+        for f in self.files:
+            f.close()
+
+    def commit(self) -> None:
+        self._drain()
+        self._close()
+        os.replace(_tmp(self.path), self.path)
+        if self.gz:
+            os.replace(_tmp(gz_path(self.path)), gz_path(self.path))
+        else:
+            gz_path(self.path).unlink(missing_ok=True)
+
+    def abort(self) -> None:
+        self._close()
+        _tmp(self.path).unlink(missing_ok=True)
+        _tmp(gz_path(self.path)).unlink(missing_ok=True)
+
+class _Fanout:
+    """
+    Developer Note: Hands each batch of records to every writer on its own thread, through a
+    bounded queue, so the JSON, CSV and HTML writers (and their gzip streams) run side by side
+    off one pass over the scored events. The first writer error is re-raised by close().
+    """
+
+    def __init__(self, writers: Dict[str, Callable[[Dict[str, Any]], None]]):
+        self.errors: List[BaseException] = []
+        self.queues: List[queue.Queue] = []
+        self.threads: List[threading.Thread] = []
+        self.batch: List[Dict[str, Any]] = []
+        for name, consume in writers.items():
+            q: queue.Queue = queue.Queue(maxsize=FANOUT_DEPTH)
+            thread = threading.Thread(target=self._run, args=(q, consume), name=f"report-{name}", daemon=True)
+            thread.start()
+            self.queues.append(q)
+            self.threads.append(thread)
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.batch.append(record)
+        if len(self.batch) >= FANOUT_BATCH:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.batch:
+            for q in self.queues:
+                q.put(self.batch)
+            self.batch = []
+
+    def _run(self, q: queue.Queue, consume: Callable[[Dict[str, Any]], None]) -> None:
+        failed = False
+        while True:
+            batch = q.get()
+            if batch is None:
+                return
+            if failed:
+                continue  # keep draining so the producer never blocks on a dead writer
+            try:
+                for record in batch:
+                    consume(record)
+            except BaseException as e:
+                self.errors.append(e)
+                failed = True
+
+    def close(self, raise_errors: bool = True) -> None:
+        self._flush()
+        for q in self.queues:
+            q.put(None)
+        for thread in self.threads:
+            thread.join()
+        if raise_errors and self.errors:
+            raise self.errors[0]
+
+class ReportRollup:
+    """Developer Note: Running counts per ROLLUP_DIMENSIONS value; O(1) per record, size bounded by distinct values."""
+
+    def __init__(self, total: int = 0, counts: Optional[Dict[str, Dict[str, int]]] = None,
+                 generated_at: Optional[str] = None, report_id: Optional[str] = None,
+                 json_file: str = "report.json", updated_at: Optional[str] = None):
+        self.report_id = report_id or uuid.uuid4().hex[:12]
+        self.json_file = json_file   # report.json or report.ndjson, whichever this run wrote
+        self.total = total
+        self.counts: Dict[str, Counter] = {dim: Counter((counts or {}).get(dim, {})) for dim in ROLLUP_DIMENSIONS}
+        self.generated_at = generated_at
+        self.updated_at = updated_at   # store rollup only: last ingest / rescore applied
+    def update(self, record: Dict[str, Any]) -> "ReportRollup":
+        timestamp = record["timestamp"]
+        self.total += 1
+        self.counts["risk_level"][record["risk_level"]] += 1
+        self.counts["business_impact"][record["business_impact"]] += 1
+        self.counts["host"][_host(record["page_url"])] += 1
+        self.counts["day"][timestamp[:10] if timestamp and timestamp != "None" else "unknown"] += 1
+        return self
+
+    @property
+    def anomalies(self) -> int:
+        return self.counts["risk_level"]["High"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"report_id": self.report_id, "generated_at": self.generated_at, "updated_at": self.updated_at,
+                "json_file": self.json_file,
+                "total_events": self.total, "anomalies": self.anomalies,
+                **{f"by_{dim}": dict(self.counts[dim]) for dim in ROLLUP_DIMENSIONS}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ReportRollup":
+        return cls(data["total_events"], {dim: data[f"by_{dim}"] for dim in ROLLUP_DIMENSIONS},
+                   data.get("generated_at"), data.get("report_id"), data.get("json_file", "report.json"),
+                   data.get("updated_at"))
+
+def rollup_path() -> Path:
+    return REPORT_DIR / ROLLUP_FILE
+
+def store_rollup_path() -> Path:
+    return REPORT_DIR / STORE_ROLLUP_FILE
+
+_ROLLUP_CACHE: Dict[str, Any] = {}
+
+@contextmanager
+def _rollup_lock():
+    # flock: ingest and rescoring update the store rollup from different workers
+    lock_path = REPORT_DIR / (ROLLUP_FILE + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+_REPORT_LOCK_DEPTH = threading.local()
+
+@contextmanager
+def report_lock():
+    """
+    Developer Note: Exclusive flock on REPORT_DIR/report.lock, held by generate() from clearing
+    its temp files to the final swap, and by anything reading the set of report files
+    (archive_service.archive_run, generate_delta's writes), so overlapping runs and readers
+    never see half of one report and half of another. Re-entrant within a thread, so a
+    generate() on_commit hook can archive the run it just swapped in.
+    """
+    depth = getattr(_REPORT_LOCK_DEPTH, "value", 0)
+    if depth:
+        _REPORT_LOCK_DEPTH.value = depth + 1
+        try:
+            yield
+        finally:
+            _REPORT_LOCK_DEPTH.value = depth
+        return
+    lock_path = REPORT_DIR / "report.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _REPORT_LOCK_DEPTH.value = 1
+        try:
+            yield
+        finally:
+            _REPORT_LOCK_DEPTH.value = 0
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    _tmp(path).write_text(json.dumps(data, indent=2))
+    os.replace(_tmp(path), path)
+
+def _load_json_cached(path: Path) -> Optional[Dict[str, Any]]:
+    # kept in memory until the file changes, so a summary request costs one stat()
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _ROLLUP_CACHE.get(str(path))
+    if cached is None or cached[0] != key:
+        cached = _ROLLUP_CACHE[str(path)] = (key, json.loads(path.read_text()))
+    return cached[1]
+
+def save_rollup(rollup: ReportRollup) -> None:
+    """Developer Note: Written by generate() only; the counts always match the report's own records."""
+    rollup.generated_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    data = rollup.to_dict()
+    data.pop("updated_at")
+    _write_json(rollup_path(), data)
+
+def load_rollup() -> Optional[Dict[str, Any]]:
+    """Developer Note: The last report's rollup as a dict, or None before the first report."""
+    return _load_json_cached(rollup_path())
+
+def _store_dict(rollup: ReportRollup) -> Dict[str, Any]:
+    data = rollup.to_dict()
+    for key in ("report_id", "generated_at", "json_file"):
+        data.pop(key)
+    return data
+
+def load_store_rollup() -> Optional[Dict[str, Any]]:
+    """
+    Developer Note: Counts over the whole event store, kept apart from the report rollup: set by
+    every rescore (scoring_service.rescore_store) and advanced by each ingest after that. None
+    until the first rescore.
+    """
+    return _load_json_cached(store_rollup_path())
+
+def apply_store_rollup_delta(rows: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Developer Note: Adds newly ingested, freshly scored rows (scoring_service.score_events) to the
+    store rollup. Read-modify-write under the rollup lock; returns the updated counts, or None (and
+    writes nothing) before the first rescore has counted the store.
+    """
+    records = [_enrich(r) for r in rows]
+    with _rollup_lock():
+        data = load_store_rollup()
+        if data is None:
+            return None
+        rollup = ReportRollup.from_dict(data)
+        for record in records:
+            rollup.update(record)
+        rollup.updated_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        _write_json(store_rollup_path(), _store_dict(rollup))
+    return _store_dict(rollup)
+
+def replace_store_rollup(recount: ReportRollup) -> Dict[str, Any]:
+    """Developer Note: Swaps in counts recomputed over the whole event store (see scoring_service.rescore_store)."""
+    recount.updated_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with _rollup_lock():
+        _write_json(store_rollup_path(), _store_dict(recount))
+    return _store_dict(recount)
+
+def generate(events: Optional[List[Any]], risks: Iterable[Dict[str, Any]], embed_events: bool = False,
+             json_format: Optional[str] = None, gzip_outputs: Optional[bool] = None,
+             on_commit: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
     """
     Generate SEA-SEQ Wave Report (HTML, CSV, JSON) with
     risk score, pattern, tier → business impact mapping.
+
+    Developer Note: `risks` may be any iterator of scored rows (e.g. scoring_service.score_stream);
+    it is consumed once. Each record is handed to the JSON, CSV and HTML page writers, which
+    run concurrently on their own threads (each with an optional .gz sibling, see REPORT_GZIP),
+    so peak memory does not grow with the report; report.html is a small index of counts
+    linking to the pages. Rollup counts are kept as records pass and saved to ROLLUP_FILE for
+    /report/summary, and every record lands in the NDJSON shards /report/events pages through
+    (with the report id beside them, so cursors are checked against the shards actually served).
+    Records stay out of the returned summary unless embed_events=True, which holds every one
+    in memory; opt in only for small runs that need the payload back.
+    `events` is only kept for existing callers; counts come from the rows actually written.
+    Files are written next to their final names and swapped in when complete, all under
+    report_lock(); on_commit(summary) runs right after the swap, still under the lock, and may
+    add keys to the summary (the route archives the run there).
     """
-    enriched = []
-    for r in risks:
-        event = r["event"]
-        risk = r["risk"]
-        pattern = r.get("pattern", "N/A")
-
-        # Determine reason + description
-        reason, description = _get_risk_reason(event, risk)
-
-        # Assign tier + business impact mapping
-        if risk >= 7:
-            risk_level = "High"
-            business_impact = "Critical Business Impact"
-        elif risk >= 4:
-            risk_level = "Medium"
-            business_impact = "Moderate Business Impact"
-        else:
-            risk_level = "Low"
-            business_impact = "Minimal Business Impact"
-
-        enriched.append({
-            "timestamp": str(getattr(event, "timestamp", None)),
-            "page_url": getattr(event, "page_url", None),
-            "https": getattr(event, "https", None),
-            "num_links": getattr(event, "num_links", None),
-            "num_forms": getattr(event, "num_forms", None),
-            "has_login_form": getattr(event, "has_login_form", None),
-            "pattern": pattern,
-            "risk": risk,
-            "risk_level": risk_level,
-            "business_impact": business_impact,
-            "risk_reason": reason,
-            "description": description,
-        })
-
-    # Write JSON
-    json_path = REPORT_DIR / "report.json"
-    with open(json_path, "w") as f:
-        json.dump(enriched, f, indent=2)
-
-    # Write CSV
+    ndjson = (json_format or REPORT_JSON_FORMAT) == "ndjson"
+    json_path = REPORT_DIR / ("report.ndjson" if ndjson else "report.json")
     csv_path = REPORT_DIR / "report.csv"
-    with open(csv_path, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=enriched[0].keys())
-        writer.writeheader()
-        writer.writerows(enriched)
-
-    # Write HTML
-    html_template = """
-    <html>
-      <head>
-        <title>SEA-SEQ Wave Report</title>
-        <style>
-          body { font-family: Arial, sans-serif; margin: 20px; }
-          h1 { color: #004085; }
-          img.logo { max-height: 80px; }
-          .low { background-color: #d4edda; }
-          .medium { background-color: #fff3cd; }
-          .high { background-color: #f8d7da; }
-          table { border-collapse: collapse; width: 100%; }
-          th, td { border: 1px solid #ddd; padding: 8px; }
-          th { background-color: #f0f4f7; }
-        </style>
-      </head>
-      <body>
-        <img src="../Logo.png" alt="Mojo Consultants Logo" class="logo"/>
-        <h1>SEA-SEQ Wave Report</h1>
-        <table>
-          <tr>
-            {% for col in records[0].keys() %}
-              <th>{{ col }}</th>
-            {% endfor %}
-          </tr>
-          {% for row in records %}
-            {% set risk = row['risk'] %}
-            {% if risk >= 7 %}
-              <tr class="high">
-            {% elif risk >= 4 %}
-              <tr class="medium">
-            {% else %}
-              <tr class="low">
-            {% endif %}
-              {% for col, val in row.items() %}
-                <td>{{ val }}</td>
-              {% endfor %}
-            </tr>
-          {% endfor %}
-        </table>
-      </body>
-    </html>
-    """
-    html = Template(html_template).render(records=enriched)
     html_path = REPORT_DIR / "report.html"
-    with open(html_path, "w") as f:
-        f.write(html)
-
-echo(f"Report generated: {html_path}, {csv_path}, {json_path}")
-return {
-    "total_events": len(events),
-    "anomalies": sum(1 for r in enriched if r["risk"] >= 7),
-    "report_html_path": str(html_path),
-    "report_csv_path": str(csv_path),
-    "report_json_path": str(json_path),
-    "events": enriched
-}
+    pages_dir = REPORT_DIR / PAGE_DIR
+    events_dir = REPORT_DIR / EVENT_DIR
+    rollup = ReportRollup(json_file=json_path.name)
+    embedded: Optional[List[Dict[str, Any]]] = [] if embed_events else None
+
+    gz = REPORT_GZIP if gzip_outputs is None else gzip_outputs
+    outputs: List[_TextOut] = []
+    event_writer: Optional[_EventShardWriter] = None
+
+    with report_lock():
+        shutil.rmtree(_tmp(pages_dir), ignore_errors=True)
+        shutil.rmtree(_tmp(events_dir), ignore_errors=True)
+        try:
+            json_out = _TextOut(json_path, gz)
+            outputs.append(json_out)
+            csv_out = _TextOut(csv_path, gz)
+            outputs.append(csv_out)
+            json_writer = _JsonWriter(json_out, ndjson)
+            csv_writer = csv.DictWriter(csv_out, fieldnames=REPORT_FIELDS)
+            csv_writer.writeheader()
+            html_writer = _PagedHtmlWriter(_tmp(pages_dir), REPORT_PAGE_SIZE, gz)
+            event_writer = _EventShardWriter(_tmp(events_dir), rollup.report_id)
+
+            fanout = _Fanout({"json": json_writer.write, "csv": csv_writer.writerow, "html": html_writer.add,
+                              "events": event_writer.add})
+            try:
+                for r in risks:
+                    record = _enrich(r)
+                    fanout.add(record)
+                    rollup.update(record)
+                    if embedded is not None:
+                        embedded.append(record)
+            except BaseException:
+                fanout.close(raise_errors=False)
+                raise
+            fanout.close()
+            json_writer.close()
+            pages = html_writer.close()
+            event_writer.close()
+
+            total = rollup.total
+            hosts = rollup.counts["host"]
+            index_out = _TextOut(html_path, gz)
+            outputs.append(index_out)
+            for chunk in env.get_template(INDEX_TEMPLATE).generate(
+                    total=total, levels=rollup.counts["risk_level"], hosts=hosts.most_common(INDEX_TOP_HOSTS),
+                    host_count=len(hosts), pages=pages, page_size=REPORT_PAGE_SIZE):
+                index_out.write(chunk)
+
+            for out in outputs:
+                out.commit()
+            outputs = []
+            shutil.rmtree(pages_dir, ignore_errors=True)
+            os.replace(_tmp(pages_dir), pages_dir)
+            shutil.rmtree(events_dir, ignore_errors=True)
+            os.replace(_tmp(events_dir), events_dir)
+            save_rollup(rollup)
+            summary = {
+                "report_id": rollup.report_id,
+                "total_events": rollup.total,
+                "anomalies": rollup.anomalies,
+                "by_risk_level": dict(rollup.counts["risk_level"]),
+                "report_html_path": str(html_path),
+                "report_csv_path": str(csv_path),
+                "report_json_path": str(json_path),
+                "html_pages": pages,
+                "events": embedded
+            }
+            if on_commit is not None:
+                on_commit(summary)
+        finally:
+            for out in outputs:
+                out.abort()
+            if event_writer is not None:
+                event_writer.close()
+            shutil.rmtree(_tmp(pages_dir), ignore_errors=True)
+            shutil.rmtree(_tmp(events_dir), ignore_errors=True)
+
+    echo(f"Report generated: {html_path}, {csv_path}, {json_path}")
+    return summary
+
+
+def _encode_cursor(report_id: str, shard: str, offset: int) -> str:
+    return urlsafe_b64encode(f"{report_id}:{shard}:{offset}".encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    try:
+        report_id, shard, offset = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        if int(offset) < 0:
+            raise ValueError(offset)
+        return report_id, shard, int(offset)
+    except ValueError:
+        raise ValueError("Malformed cursor.") from None
+
+@contextmanager
+def _events_dir():
+    """
+    Developer Note: Yields (report_id, opener) for the current report's events directory. The id
+    and any shard opened with `opener` come through one directory handle, so a report swapped
+    in meanwhile cannot pair one report's id with another's records.
+    """
+    try:
+        dir_fd = os.open(REPORT_DIR / EVENT_DIR, os.O_RDONLY)
+    except FileNotFoundError:
+        raise FileNotFoundError("No report yet; generate one first.") from None
+    opener = lambda name, flags: os.open(name, flags, dir_fd=dir_fd)
+    try:
+        try:
+            with open(EVENT_REPORT_ID_FILE, opener=opener) as f:
+                report_id = f.read().strip()
+        except FileNotFoundError:
+            raise FileNotFoundError("Report predates event paging; generate a new one.") from None
+        yield report_id, opener
+    finally:
+        os.close(dir_fd)
+
+def current_report_id() -> str:
+    """Developer Note: Id of the report whose records are being served; FileNotFoundError before the first."""
+    with _events_dir() as (report_id, _):
+        return report_id
+
+def page_events(cursor: Optional[str] = None, risk_level: str = "all", limit: int = 100,
+                fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Developer Note: One page of the current report's records, oldest first, optionally limited to
+    a risk level and projected to `fields`. Pass back next_cursor for the following page; it is
+    None on the last one. A cursor only works on the report it came from: ValueError once the
+    report has been regenerated (or for bad input), FileNotFoundError before the first report.
+    """
+    shard, offset = risk_level.lower(), 0
+    cursor_report = None
+    if cursor:
+        cursor_report, shard, offset = _decode_cursor(cursor)
+    if shard not in PAGE_SHARDS:
+        raise ValueError(f"risk_level must be one of {PAGE_SHARDS}.")
+    unknown = [f for f in fields or [] if f not in REPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown}; choose from {REPORT_FIELDS}.")
+    limit = max(1, min(limit, EVENTS_PAGE_LIMIT))
+
+    items: List[Dict[str, Any]] = []
+    with _events_dir() as (report_id, opener):
+        if cursor_report is not None and cursor_report != report_id:
+            raise ValueError(f"Cursor belongs to report {cursor_report}; the current report is {report_id}.")
+        with open(f"{shard}.ndjson", "rb", opener=opener) as f:
+            f.seek(offset)
+            while len(items) < limit:
+                line = f.readline()
+                if not line:
+                    break
+                record = json.loads(line)
+                items.append({k: record[k] for k in fields} if fields else record)
+            offset = f.tell()
+            more = bool(f.read(1))
+    return {
+        "report_id": report_id,
+        "risk_level": shard,
+        "count": len(items),
+        "items": items,
+        "next_cursor": _encode_cursor(report_id, shard, offset) if more else None,
+    }
+
+
+def print_html() -> Tuple[str, str]:
+    """
+    Developer Note: The current report as one HTML document, counts plus every record, read from
+    the "all" shard; returns (report_id, html). render_service snapshots this, not the report.html
+    index. Built in memory, as the PDF / PNG renderer needs the whole document anyway.
+    """
+    with _events_dir() as (report_id, opener):
+        with open("all.ndjson", "rb", opener=opener) as f:
+            levels = Counter(json.loads(line)["risk_level"] for line in f)
+            f.seek(0)
+            html = env.get_template(PRINT_TEMPLATE).render(
+                report_id=report_id, total=sum(levels.values()), levels=levels,
+                records=(json.loads(line) for line in f), columns=REPORT_FIELDS)
+    return report_id, html
+
+
+# ===============================
+# Chapter 4: Delta Reports
+# ===============================
+# A finding is identified by its page URL; it counts as changed when any of these differ.
+DELTA_FIELDS = ["https", "num_links", "num_forms", "has_login_form", "pattern", "risk"]
+DELTA_DIR = "delta"
+DELTA_CSV_FIELDS = ["change", "previous_risk", "previous_risk_level"] + REPORT_FIELDS
+
+def _fingerprint(record: Dict[str, Any]) -> str:
+    return str(record["page_url"])
+
+def _scored_fields(r: Dict[str, Any]) -> Dict[str, Any]:
+    """Developer Note: page_url and DELTA_FIELDS of a scored row, read straight off the event (no _enrich)."""
+    event = r["event"]
+    return {"page_url": getattr(event, "page_url", None), "https": getattr(event, "https", None),
+            "num_links": getattr(event, "num_links", None), "num_forms": getattr(event, "num_forms", None),
+            "has_login_form": getattr(event, "has_login_form", None), "pattern": r.get("pattern", "N/A"),
+            "risk": r["risk"]}
+
+def _row_hash(record: Dict[str, Any]) -> bytes:
+    # str() of each value, exactly as the CSV writer renders it, so archived CSV rows hash the same
+    text = "\x1f".join(str(record[field]) for field in DELTA_FIELDS)
+    return hashlib.blake2b(text.encode(), digest_size=12).digest()
+
+def generate_delta(risks: Iterable[Dict[str, Any]], base_rows: Iterable[Dict[str, str]], base_run: str,
+                   gzip_outputs: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Developer Note: Compares scored events with an archived run (see archive_service) and writes
+    only what changed to REPORT_DIR/delta: new, changed and resolved findings plus a summary.
+    Rows are compared on the fields read straight off the scored event, so unchanged findings
+    are never enriched or rendered and the write cost tracks the number of changes; scoring
+    them is mostly score-cache hits. The base run's report stays the full picture.
+    Memory holds one small hash per finding and full records only for changed ones. When a
+    page appears more than once (re-crawls), the last occurrence wins on both sides.
+    """
+    base: Dict[str, tuple] = {}
+    for row in base_rows:
+        base[_fingerprint(row)] = (_row_hash(row), row["risk"], row["risk_level"])
+
+    current: Dict[str, bytes] = {}
+    changes: Dict[str, Dict[str, Any]] = {}
+    for r in risks:
+        fields = _scored_fields(r)
+        fp, digest = _fingerprint(fields), _row_hash(fields)
+        current[fp] = digest
+        if fp in base and base[fp][0] == digest:
+            changes.pop(fp, None)
+        else:
+            changes[fp] = _enrich(r)
+
+    rows: List[Dict[str, Any]] = []
+    for fp, record in changes.items():
+        previous = base.get(fp)
+        rows.append({"change": "changed" if previous else "new",
+                     "previous_risk": previous[1] if previous else None,
+                     "previous_risk_level": previous[2] if previous else None, **record})
+    for fp, (_, risk, level) in base.items():
+        if fp not in current:
+            rows.append({"change": "resolved", "previous_risk": risk, "previous_risk_level": level,
+                         **{field: None for field in REPORT_FIELDS}, "page_url": fp})
+    counts = Counter(row["change"] for row in rows)
+    summary = {
+        "base_run": base_run,
+        "total_events": len(current),
+        "new": counts["new"],
+        "changed": counts["changed"],
+        "resolved": counts["resolved"],
+        "unchanged": len(current) - counts["new"] - counts["changed"],
+    }
+
+    delta_dir = REPORT_DIR / DELTA_DIR
+    gz = REPORT_GZIP if gzip_outputs is None else gzip_outputs
+    paths = {name: delta_dir / f"delta.{name}" for name in ("json", "csv", "html")}
+    with report_lock():  # the .tmp names are shared with any other delta or generate run
+        delta_dir.mkdir(parents=True, exist_ok=True)
+        outputs = {name: _TextOut(path, gz) for name, path in paths.items()}
+        try:
+            outputs["json"].write(json.dumps({"summary": summary, "rows": rows}, indent=2, default=str))
+            writer = csv.DictWriter(outputs["csv"], fieldnames=DELTA_CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+            for chunk in env.get_template(DELTA_TEMPLATE).generate(summary=summary, rows=rows, columns=DELTA_CSV_FIELDS):
+                outputs["html"].write(chunk)
+            for out in outputs.values():
+                out.commit()
+        except BaseException:
+            for out in outputs.values():
+                out.abort()
+            raise
+
+    echo(f"Delta report generated against {base_run}: {paths['html']}")
+    return {**summary, **{f"delta_{name}_path": str(path) for name, path in paths.items()}}
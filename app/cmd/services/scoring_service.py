@@ -0,0 +1,142 @@
+# ===============================
+# Chapter 1: Imports and Setup
+# ===============================
+# This chapter sets up the combined rule + ML scoring pipeline used by report generation.
+import os
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+from app.services import cache_service, data_service, learning_service, reporting_service, risk_rules
+
+# Max points the IsolationForest anomaly score (0..1) can add on top of the rule score
+ML_RISK_WEIGHT = float(os.getenv("ML_RISK_WEIGHT", "5"))
+# The anomaly score is a calibrated quantile (0.5 = a median event), so only the tail above this
+# adds points, ramping from 0 here to ML_RISK_WEIGHT at 1. Ordinary events with no rule hit stay Low.
+ML_ANOMALY_FLOOR = float(os.getenv("ML_ANOMALY_FLOOR", "0.9"))
+
+def ml_points(anomaly: np.ndarray) -> np.ndarray:
+    """Developer Note: Risk points for 0..1 anomaly scores: nothing up to ML_ANOMALY_FLOOR, then linear."""
+    tail = np.clip((np.asarray(anomaly) - ML_ANOMALY_FLOOR) / max(1 - ML_ANOMALY_FLOOR, 1e-9), 0, 1)
+    return ML_RISK_WEIGHT * tail
+
+# ===============================
+# Chapter 2: Combined Scoring
+# ===============================
+def _ml_risk(events: List[Any]) -> np.ndarray:
+    """Developer Note: Returns 0..1 anomaly risk per event, or None when no model is trained yet."""
+    try:
+        return learning_service.score(events)
+    except FileNotFoundError:
+        return None
+
+def _score_uncached(events: List[Any]) -> List[Dict[str, Any]]:
+    """Developer Note: Runs the rule engine and the IsolationForest; rows carry everything but the event."""
+    rule_risk, components = risk_rules.score_batch(events)
+    anomaly = _ml_risk(events)
+
+    risk = rule_risk.astype(float)
+    if anomaly is not None:
+        risk = np.minimum(risk + ml_points(anomaly), risk_rules.ENGINE.plan().max_risk)
+    risk = np.round(risk, 2)
+
+    names = list(components)
+    fired = np.column_stack([components[name] for name in names])
+    rows = []
+    for i in range(len(events)):
+        breakdown = {name: bool(components[name][i]) for name in names}
+        breakdown["rule_risk"] = float(rule_risk[i])
+        breakdown["anomaly"] = None if anomaly is None else round(float(anomaly[i]), 4)
+        pattern = "+".join(name for name, hit in zip(names, fired[i]) if hit) or "N/A"
+        rows.append({"risk": float(risk[i]), "pattern": pattern, "components": breakdown})
+    return rows
+
+def score_events(events: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Developer Note: Scores a batch with the rule engine and the IsolationForest in one pass.
+    Returns the {"event", "risk", "pattern", "components"} rows reporting_service.generate consumes;
+    risk is on the report's 0..10 scale and components holds the per-rule / ML breakdown.
+    Events whose content was scored before under the same rulebook and model come from the
+    score cache; only the rest are evaluated.
+    """
+    if not events:
+        return []
+    cache = cache_service.get_cache()
+    if cache is None:
+        rows = _score_uncached(events)
+    else:
+        versions = cache_service.current_versions()
+        keys = [cache_service.event_key(event, versions) for event in events]
+        cached = cache.get_many(keys, versions)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            fresh = _score_uncached([events[i] for i in missing])
+            cached.update({keys[i]: row for i, row in zip(missing, fresh)})
+            cache.put_many({keys[i]: row for i, row in zip(missing, fresh)}, versions)
+        rows = [cached[key] for key in keys]
+    return [{"event": event, **row} for event, row in zip(events, rows)]
+
+def score_stream(chunks: Iterable[List[Any]]) -> Iterator[Dict[str, Any]]:
+    """Developer Note: score_events over event chunks, yielding rows one by one so a report never holds every event."""
+    for chunk in chunks:
+        yield from score_events(chunk)
+
+def _score_chunk_job(events: List[Any], instrumented: bool) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, List[float]]]]:
+    """Developer Note: Runs in a worker process; rule timings go back to the parent, which owns /rules/stats."""
+    if instrumented != (risk_rules.ENGINE.stats is not None):
+        risk_rules.ENGINE.set_stats(risk_rules.RULE_STATS if instrumented else None)
+    rows = score_events(events)
+    return rows, risk_rules.RULE_STATS.drain() if instrumented else None
+
+def score_stream_offloaded(chunks: Iterable[List[Any]], submit: Callable[..., Future]) -> Iterator[Dict[str, Any]]:
+    """
+    Developer Note: score_stream with each chunk scored through `submit` (e.g. executors.CPU.submit),
+    one chunk ahead of the consumer, so the calling thread only reads events and writes output.
+    Rows come back in chunk order; Saturated from submit propagates to the caller.
+    """
+    instrumented = risk_rules.ENGINE.stats is not None
+
+    def collect(job: Future) -> List[Dict[str, Any]]:
+        rows, stats = job.result()
+        if stats:
+            risk_rules.ENGINE.stats.merge(stats)
+        return rows
+
+    pending: Optional[Future] = None
+    for chunk in chunks:
+        job = submit(_score_chunk_job, chunk, instrumented)
+        if pending is not None:
+            yield from collect(pending)
+        pending = job
+    if pending is not None:
+        yield from collect(pending)
+
+def record_ingest(events: List[Any]) -> None:
+    """
+    Developer Note: data_service.crawl_site on_persist hook: scores the new events (warming the
+    score cache) and adds them to the store rollup. Runs under the store lock after the append,
+    so it never races a rescore's recount.
+    """
+    reporting_service.apply_store_rollup_delta(score_events(events))
+
+def rescore_store(chunk_size: int = learning_service.SCORE_CHUNK_SIZE) -> Iterator[int]:
+    """
+    Developer Note: Writes fresh anomaly scores back to the whole event store (learning_service.score_chunks)
+    and, from the same pass, recounts the store rollup; the recount plus whatever ingest appended
+    meanwhile is swapped in with the rewrite. The last report's rollup is left alone.
+    Yields the size of each written chunk.
+    """
+    recount = reporting_service.ReportRollup()
+
+    def transform(chunks: Iterable[List[Any]]) -> Iterator[List[Any]]:
+        for chunk in learning_service.score_chunks(chunks):
+            for row in score_events(chunk):
+                recount.update(reporting_service._enrich(row))
+            yield chunk
+
+    def on_commit(carried: List[Any]) -> None:
+        for row in score_events(carried):
+            recount.update(reporting_service._enrich(row))
+        reporting_service.replace_store_rollup(recount)
+
+    return data_service.rewrite_store(transform, chunk_size, on_commit=on_commit)
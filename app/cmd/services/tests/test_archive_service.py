@@ -0,0 +1,194 @@
+# ===============================
+# Chapter 1: Unit Tests for archive_service.py
+# ===============================
+import pytest
+
+from app.services import archive_service, reporting_service
+from app.models.events import SecurityEvent
+
+def scored(url, risk, https=True):
+    event = SecurityEvent(page_url=url, https=https, num_links=1, num_forms=0, has_login_form=False, headers={})
+    return {"event": event, "risk": float(risk), "pattern": "N/A" if risk < 3 else "no_https"}
+
+def use_tmp_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(reporting_service, "REPORT_DIR", tmp_path)
+    monkeypatch.setattr(archive_service, "REPORT_DIR", tmp_path)
+    monkeypatch.setattr(archive_service, "ARCHIVE_DIR", tmp_path / "archive")
+
+def test_runs_share_blobs_and_are_listed_from_the_index(tmp_path, monkeypatch):
+    use_tmp_dirs(tmp_path, monkeypatch)
+    (tmp_path / "archive" / "29991231_000000").mkdir(parents=True)  # legacy folder, not in the index
+    assert archive_service.latest_run() is None
+    reporting_service.generate(None, [scored("https://a.com/1", 0)])
+    first = archive_service.archive_run()
+    blobs = sorted((tmp_path / "archive" / "blobs").glob("*/*"))
+    second = archive_service.archive_run()  # same content: nothing new is stored
+    assert sorted((tmp_path / "archive" / "blobs").glob("*/*")) == blobs
+    assert archive_service.latest_run() == second
+    assert set(archive_service.load_index()["runs"]) == {first, second}
+    assert archive_service.artifact_path(first, "pages/all-0001.html").exists()
+    assert [row["page_url"] for row in archive_service.iter_run_rows(first)] == ["https://a.com/1"]
+
+def test_gc_keeps_newest_runs_and_their_blobs(tmp_path, monkeypatch):
+    use_tmp_dirs(tmp_path, monkeypatch)
+    monkeypatch.setattr(archive_service, "GC_GRACE_SECONDS", 0)
+    reporting_service.generate(None, [scored("https://a.com/1", 0)])
+    old = archive_service.archive_run()
+    reporting_service.generate(None, [scored("https://a.com/2", 8)])
+    new = archive_service.archive_run()
+    result = archive_service.gc(keep=1)
+    assert result["removed_runs"] == [old] and result["removed_blobs"] > 0
+    assert list(archive_service.load_index()["runs"]) == [new]
+    for entry in archive_service.load_manifest(new)["files"].values():
+        assert archive_service.blob_path(entry["sha256"]).exists()
+
+def test_gc_marks_unindexed_manifests_and_skips_missing_ones(tmp_path, monkeypatch):
+    use_tmp_dirs(tmp_path, monkeypatch)
+    monkeypatch.setattr(archive_service, "GC_GRACE_SECONDS", 0)
+    reporting_service.generate(None, [scored("https://a.com/1", 0)])
+    lost = archive_service.archive_run()
+    reporting_service.generate(None, [scored("https://a.com/2", 8)])
+    pending = archive_service.archive_run()
+    reporting_service.generate(None, [scored("https://a.com/3", 5)])
+    newest = archive_service.archive_run()
+    archive_service._manifest_path(lost).unlink()  # indexed, manifest gone
+    index = archive_service.load_index()
+    del index["runs"][pending]  # manifest written, index entry not (yet)
+    archive_service._save_index(index)
+
+    result = archive_service.gc(keep=1)
+    assert result["removed_runs"] == [lost]
+    for run_id in (pending, newest):
+        for entry in archive_service.load_manifest(run_id)["files"].values():
+            assert archive_service.blob_path(entry["sha256"]).exists()
+
+def test_delta_reports_new_changed_and_resolved(tmp_path, monkeypatch):
+    use_tmp_dirs(tmp_path, monkeypatch)
+    reporting_service.generate(None, [scored("https://a.com/1", 0), scored("https://a.com/2", 0),
+                                      scored("https://a.com/3", 3, https=False)])
+    base = archive_service.archive_run()
+    current = [scored("https://a.com/1", 0), scored("https://a.com/3", 0), scored("https://a.com/4", 8)]
+    enriched = []
+    real_enrich = reporting_service._enrich
+    monkeypatch.setattr(reporting_service, "_enrich", lambda r: enriched.append(r) or real_enrich(r))
+    summary = reporting_service.generate_delta(current, archive_service.iter_run_rows(base), base)
+    assert (summary["new"], summary["changed"], summary["resolved"], summary["unchanged"]) == (1, 1, 1, 1)
+    assert [str(r["event"].page_url) for r in enriched] == ["https://a.com/3", "https://a.com/4"]  # not the unchanged /1
+    with open(summary["delta_csv_path"]) as f:
+        lines = f.read().splitlines()
+    changes = {line.split(",")[0]: line for line in lines[1:]}
+    assert "https://a.com/4" in changes["new"]
+    assert changes["changed"].startswith("changed,3.0,Low,")
+    assert "https://a.com/2" in changes["resolved"]
+
+def test_rollup_counts_match_the_report_and_are_archived(tmp_path, monkeypatch):
+    use_tmp_dirs(tmp_path, monkeypatch)
+    assert reporting_service.load_rollup() is None
+    reporting_service.generate(None, [scored("https://a.com/1", 0), scored("https://a.com/2", 8),
+                                      scored("https://b.com/1", 5)])
+    rollup = reporting_service.load_rollup()
+    assert rollup["total_events"] == 3 and rollup["anomalies"] == 1
+    assert rollup["by_risk_level"] == {"Low": 1, "High": 1, "Medium": 1}
+    assert rollup["by_host"] == {"a.com": 2, "b.com": 1}
+    assert sum(rollup["by_day"].values()) == sum(rollup["by_business_impact"].values()) == 3
+    run = archive_service.archive_run()
+    assert archive_service.artifact_path(run, "rollup.json").exists()
+    reporting_service.generate(None, [scored("https://a.com/1", 0)])
+    assert reporting_service.load_rollup()["total_events"] == 1
+
+def test_store_rollup_follows_ingest_and_rescoring_apart_from_the_report(tmp_path, monkeypatch, requests_mock):
+    from app.services import cache_service, data_service, drift_service, learning_service, scoring_service
+    use_tmp_dirs(tmp_path, monkeypatch)
+    monkeypatch.setattr(data_service, "EVENTS_PATH", tmp_path / "events.jsonl")
+    monkeypatch.setattr(drift_service, "LIVE_STATS_PATH", tmp_path / "feature_stats.json")
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    monkeypatch.setattr(cache_service, "SCORE_CACHE_ENABLED", False)
+    monkeypatch.setattr(data_service, "get_target_site", lambda: "https://c.com/")
+    monkeypatch.setattr(data_service.time, "sleep", lambda seconds: None)
+    requests_mock.get("https://c.com/", text="<html><body><p>Welcome</p></body></html>")
+    crawl = lambda: data_service.crawl_site(max_pages=1, on_persist=scoring_service.record_ingest)
+
+    crawl()  # before the first rescore: no store counts to advance
+    assert reporting_service.load_store_rollup() is None
+    summary = reporting_service.generate(None, [scored("https://a.com/1", 0), scored("https://a.com/2", 8)])
+    report = reporting_service.load_rollup()
+    crawl()
+
+    learning_service.train(data_service.load_events() * 10)
+    assert sum(data_service.rewrite_store(lambda chunks: chunks)) == 2  # no-op rewrite, no rollup
+    assert reporting_service.load_store_rollup() is None
+    assert sum(scoring_service.rescore_store(chunk_size=1)) == 2
+    store = reporting_service.load_store_rollup()
+    assert store["total_events"] == 2 and store["by_host"] == {"c.com": 2}
+    crawl()
+    store = reporting_service.load_store_rollup()
+    assert store["total_events"] == 3 and store["updated_at"] is not None
+
+    # the report's own counts and id never move: they match what /report/events pages through
+    assert reporting_service.load_rollup() == report
+    assert report["report_id"] == summary["report_id"] and report["total_events"] == 2
+    assert report["by_host"] == {"a.com": 2}
+
+    # a failing hook is logged; the crawled events are kept
+    monkeypatch.setattr(scoring_service, "score_events", lambda events: 1 / 0)
+    crawl()
+    assert len(data_service.load_events()) == 4
+    assert reporting_service.load_store_rollup()["total_events"] == 3
+
+def test_events_are_paged_by_cursor_with_filter_and_projection(tmp_path, monkeypatch):
+    use_tmp_dirs(tmp_path, monkeypatch)
+    rows = [scored(f"https://a.com/{i}", 8 if i % 3 == 0 else 0) for i in range(10)]
+    assert len(reporting_service.generate(None, rows, embed_events=True)["events"]) == 10
+    summary = reporting_service.generate(None, rows)
+    assert summary["events"] is None  # records are paged, not embedded, unless asked for
+    seen, cursor = [], None
+    while True:
+        page = reporting_service.page_events(cursor, limit=4, fields=["page_url", "risk"])
+        assert page["report_id"] == summary["report_id"] and set(page["items"][0]) == {"page_url", "risk"}
+        seen += [item["page_url"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"https://a.com/{i}" for i in range(10)]
+    high = reporting_service.page_events(risk_level="High", limit=10)
+    assert [r["page_url"] for r in high["items"]] == [f"https://a.com/{i}" for i in (0, 3, 6, 9)]
+    assert high["next_cursor"] is None
+    stale = reporting_service.page_events(limit=2)["next_cursor"]
+    reporting_service.generate(None, rows)
+    with pytest.raises(ValueError):
+        reporting_service.page_events(stale)
+    with pytest.raises(ValueError):
+        reporting_service.page_events(fields=["secret"])
+
+def test_overlapping_generates_each_archive_their_own_report(tmp_path, monkeypatch):
+    use_tmp_dirs(tmp_path, monkeypatch)
+    monkeypatch.setattr(reporting_service, "REPORT_PAGE_SIZE", 2)
+    import threading, time as _time
+    runs, errors, second = {}, [], []
+
+    def run(name, rows):
+        def archive(summary):
+            runs[name] = archive_service.archive_run(summary={"total_events": summary["total_events"]})
+        try:
+            reporting_service.generate(None, rows, on_commit=archive)
+        except Exception as e:
+            errors.append(e)
+
+    def first_rows():
+        for i in range(7):
+            if i == 3:  # a second report starts while this one is half written
+                second.append(threading.Thread(target=run, args=("b", [scored(f"https://b.com/{j}", 0) for j in range(4)])))
+                second[0].start()
+                _time.sleep(0.2)
+            yield scored(f"https://a.com/{i}", 0)
+
+    run("a", first_rows())
+    second[0].join()
+    assert not errors
+    for name, n in (("a", 7), ("b", 4)):
+        rows = list(archive_service.iter_run_rows(runs[name]))
+        assert [r["page_url"] for r in rows] == [f"https://{name}.com/{i}" for i in range(n)]
+        pages = [f for f in archive_service.load_manifest(runs[name])["files"] if f.startswith("pages/all-")]
+        assert len(pages) == (n + 1) // 2
+    assert reporting_service.load_rollup()["total_events"] == 4  # the later run is the current report
+    assert not list(tmp_path.glob("*.tmp"))
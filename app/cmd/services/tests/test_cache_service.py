@@ -0,0 +1,48 @@
+# ===============================
+# Chapter 1: Unit Tests for cache_service.py
+# ===============================
+from app.services import cache_service
+from app.models.events import SecurityEvent
+
+def make_event(**overrides):
+    fields = dict(page_url="https://a.com", https=True, num_links=1, num_forms=0, has_login_form=False, headers={})
+    fields.update(overrides)
+    return SecurityEvent(**fields)
+
+def test_event_key_ignores_timestamp_and_scores():
+    versions = ("rules1", "model1")
+    a, b = make_event(), make_event(risk=7.0, anomaly_score=0.3)
+    assert cache_service.event_key(a, versions) == cache_service.event_key(b, versions)
+    assert cache_service.event_key(a, versions) != cache_service.event_key(make_event(num_links=2), versions)
+    assert cache_service.event_key(a, versions) != cache_service.event_key(a, ("rules2", "model1"))
+
+def test_scoring_code_change_changes_versions(monkeypatch, tmp_path):
+    source = tmp_path / "risk_rules.py"
+    source.write_text("MAX_RISK = 10\n")
+    before = cache_service.code_version([source])
+    source.write_text("MAX_RISK = 9\n")
+    assert cache_service.code_version([source]) != before
+
+    versions = cache_service.current_versions()
+    assert versions[0] == cache_service.SCORE_CODE_VERSION
+    monkeypatch.setattr(cache_service, "SCORE_CODE_VERSION", "patched")
+    assert cache_service.current_versions() == ("patched", *versions[1:])
+    event = make_event()
+    assert cache_service.event_key(event, versions) != cache_service.event_key(event, cache_service.current_versions())
+
+def test_version_change_clears_cache(tmp_path):
+    cache = cache_service.ScoreCache(tmp_path / "cache.sqlite")
+    cache.put_many({"k1": {"risk": 1.0}}, ("r1", "m1"))
+    assert cache.get_many(["k1", "k2"], ("r1", "m1")) == {"k1": {"risk": 1.0}}
+    assert cache.get_many(["k1"], ("r2", "m1")) == {}
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_least_recently_used_rows_are_evicted(tmp_path):
+    cache = cache_service.ScoreCache(tmp_path / "cache.sqlite", max_rows=2)
+    versions = ("r", "m")
+    cache.put_many({"old": {"risk": 1.0}}, versions)
+    cache.put_many({"mid": {"risk": 2.0}}, versions)
+    cache.get_many(["old"], versions)  # touch: "mid" is now least recently used
+    cache.put_many({"new": {"risk": 3.0}}, versions)
+    assert set(cache.get_many(["old", "mid", "new"], versions)) == {"old", "new"}
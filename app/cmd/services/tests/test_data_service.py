@@ -21,3 +21,67 @@ def test_fetch_and_event_from_response(requests_mock):
     assert event.num_links == 1
     assert event.num_forms == 1
     assert event.has_login_form is True
+
+def test_iter_and_rewrite_events(monkeypatch, tmp_path):
+    events_path = tmp_path / "events.jsonl"
+    monkeypatch.setattr(data_service, "EVENTS_PATH", events_path)
+    with open(events_path, "w") as f:
+        for i in range(5):
+            ev = data_service.SecurityEvent(page_url=f"https://example.com/{i}", https=True,
+                                            num_links=i, num_forms=0, has_login_form=False)
+            f.write(ev.model_dump_json() + "\n")
+    chunks = list(data_service.iter_event_chunks(chunk_size=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    for chunk in chunks:
+        for ev in chunk:
+            ev.anomaly_score = 0.5
+    assert list(data_service.rewrite_events(chunks)) == [2, 2, 1]
+    reloaded = data_service.load_events()
+    assert len(reloaded) == 5
+    assert all(ev.anomaly_score == 0.5 for ev in reloaded)
+    assert not (tmp_path / "events.jsonl.tmp").exists()
+
+def test_body_is_scanned_while_streaming(requests_mock, monkeypatch):
+    monkeypatch.setattr(data_service, "FETCH_CHUNK_BYTES", 16)
+    url = "https://example.com/billing"
+    html = "<html><body><p>Patient card 4111111111111111 on file</p></body></html>"
+    requests_mock.get(url, text=html)
+    _, response = data_service._fetch(url)
+    event = data_service._event_from_response(url, response)
+    assert event.body_matches == {"phi_patient": 1, "credit_card": 1}
+    assert any("1111" in s and "4111111111111111" not in s for s in event.body_snippets)
+
+def test_body_scan_ignores_markup(requests_mock):
+    url = "https://example.com/contact"
+    html = ('<html><head><style>.lab-results { color: red }</style><script>var record = 4111111111111111;</script></head>'
+            '<body><form><label for="q">Search</label><input name="record_id"></form>'
+            '<p class="collaborate">Tickets available online. Call us to book.</p></body></html>')
+    requests_mock.get(url, text=html, headers={"content-type": "text/html; charset=utf-8"})
+    _, response = data_service._fetch(url)
+    event = data_service._event_from_response(url, response)
+    assert event.body_matches == {}
+    assert event.body_snippets == []
+
+def test_rewrite_store_keeps_events_appended_mid_rewrite(monkeypatch, tmp_path):
+    events_path = tmp_path / "events.jsonl"
+    monkeypatch.setattr(data_service, "EVENTS_PATH", events_path)
+    make = lambda i: data_service.SecurityEvent(page_url=f"https://example.com/{i}", https=True,
+                                                 num_links=i, num_forms=0, has_login_form=False)
+    with open(events_path, "w") as f:
+        for i in range(4):
+            f.write(make(i).model_dump_json() + "\n")
+
+    def transform(chunks):
+        for chunk in chunks:
+            for ev in chunk:
+                ev.anomaly_score = 0.5
+            # an ingest landing while the rewrite is in progress
+            with open(events_path, "a") as f:
+                f.write(make(100 + chunk[0].num_links).model_dump_json() + "\n")
+            yield chunk
+
+    assert list(data_service.rewrite_store(transform, chunk_size=2)) == [2, 2]
+    reloaded = data_service.load_events()
+    assert [ev.num_links for ev in reloaded] == [0, 1, 2, 3, 100, 102]
+    assert [ev.anomaly_score for ev in reloaded] == [0.5] * 4 + [None] * 2
+    assert not list(tmp_path.glob("*.tmp"))
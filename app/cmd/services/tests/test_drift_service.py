@@ -0,0 +1,40 @@
+# ===============================
+# Chapter 1: Unit Tests for drift_service.py
+# ===============================
+import numpy as np
+from app.services import drift_service, learning_service
+from app.models.events import SecurityEvent
+
+def make_events(num_links, n):
+    return [SecurityEvent(page_url="https://a.com", https=True, num_links=num_links, num_forms=1,
+                          has_login_form=False, headers={}) for _ in range(n)]
+
+def test_feature_stats_match_numpy():
+    X = np.random.default_rng(0).integers(0, 50, size=(100, 4)).astype(float)
+    stats = drift_service.FeatureStats().update(X[:30]).update(X[30:])
+    assert stats.count == 100
+    assert np.allclose(stats.mean, X.mean(axis=0))
+    assert np.allclose(stats.variance, X.var(axis=0))
+    assert stats.hist.sum() == 400
+
+def test_drift_report_flags_shifted_ingest(tmp_path, monkeypatch):
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    monkeypatch.setattr(drift_service, "LIVE_STATS_PATH", tmp_path / "feature_stats.json")
+    learning_service.train(make_events(5, 60))
+    drift_service.record_ingested(make_events(5, 60))
+    report = drift_service.drift_report()
+    assert report["live_count"] == 60
+    assert report["retrain_recommended"] is False
+
+    drift_service.record_ingested(make_events(300, 200))
+    report = drift_service.drift_report()
+    assert report["drift_score"] >= drift_service.DRIFT_THRESHOLD
+    assert report["retrain_recommended"] is True
+
+def test_feature_stats_subtract_undoes_merge():
+    X = np.random.default_rng(1).integers(0, 50, size=(100, 4)).astype(float)
+    rest = drift_service.FeatureStats().update(X).subtract(drift_service.FeatureStats().update(X[:40]))
+    assert rest.count == 60
+    assert np.allclose(rest.mean, X[40:].mean(axis=0))
+    assert np.allclose(rest.variance, X[40:].var(axis=0))
+    assert np.array_equal(rest.hist, drift_service.FeatureStats().update(X[40:]).hist)
@@ -3,9 +3,14 @@
 # ===============================
 import pytest
 import numpy as np
-from app.services import learning_service
+from app.services import drift_service, learning_service
 from app.models.events import SecurityEvent
 
+@pytest.fixture(autouse=True)
+def live_stats_path(tmp_path, monkeypatch):
+    # train() consumes the drift live stats; keep that file out of the working directory
+    monkeypatch.setattr(drift_service, "LIVE_STATS_PATH", tmp_path / "feature_stats.json")
+
 def make_events():
     return [
         SecurityEvent(page_url="http://a.com", https=True, num_links=5, num_forms=1, has_login_form=False, headers={}),
@@ -27,3 +32,54 @@ def test_train_and_score(tmp_path, monkeypatch):
     scores = learning_service.score(events)
     assert len(scores) == 20
     assert np.all(scores >= 0) and np.all(scores <= 1)
+
+def test_score_chunks_sets_anomaly_score(tmp_path, monkeypatch):
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    events = make_events() * 10
+    learning_service.train(events)
+    chunks = [events[:7], events[7:14], events[14:]]
+    scored = list(learning_service.score_chunks(chunks))
+    assert [len(c) for c in scored] == [7, 7, 6]
+    assert all(0 <= ev.anomaly_score <= 1 for c in scored for ev in c)
+
+def test_score_chunks_requires_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "missing.pkl")
+    with pytest.raises(FileNotFoundError):
+        learning_service.score_chunks([make_events()])
+
+def test_score_is_independent_of_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    events = make_events() * 10
+    learning_service.train(events)
+    batch = learning_service.score(events)
+    single = np.concatenate([learning_service.score([ev]) for ev in events])
+    assert np.allclose(batch, single)
+
+def test_warm_up_caches_memory_mapped_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    learning_service.train(make_events() * 10)
+    stats = learning_service.warm_up()
+    assert stats["load_seconds"] is not None
+    assert stats["warmup_seconds"] is not None
+    assert learning_service._load_model() is learning_service._load_model()
+    assert isinstance(learning_service._load_model()["calibration"], np.memmap)
+
+def test_train_keeps_live_stats_recorded_after_its_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    drift_service.record_ingested(make_events() * 10)
+    started_from = drift_service.snapshot_live_stats()
+    late = make_events()[:1] * 3
+    drift_service.record_ingested(late)  # arrives while the model is fitting
+    learning_service.train(make_events() * 10, started_from)
+    live = drift_service.load_live_stats()
+    assert live.count == 3
+    assert np.allclose(live.mean, learning_service._featurize(late).mean(axis=0))
+    assert np.allclose(live.variance, 0)
+    assert live.hist.sum() == 3 * len(learning_service.FEATURES)
+
+def test_train_from_store_loads_events_itself(tmp_path, monkeypatch):
+    from app.services import data_service
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    monkeypatch.setattr(data_service, "EVENTS_PATH", tmp_path / "events.jsonl")
+    (tmp_path / "events.jsonl").write_text("".join(ev.model_dump_json() + "\n" for ev in make_events() * 10))
+    assert learning_service.train_from_store().trained_on == 20
@@ -0,0 +1,90 @@
+# ===============================
+# Chapter 1: Unit Tests for render_service.py
+# ===============================
+import threading
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import render_service
+
+class FakeHTML:
+    """Stands in for weasyprint.HTML; write_pdf waits on `gate` so a test can see the job in flight."""
+    gate = threading.Event()
+    calls = []
+
+    def __init__(self, string, base_url):
+        self.string = string
+
+    def write_pdf(self, target):
+        FakeHTML.gate.wait(5)
+        FakeHTML.calls.append(self.string)
+        with open(target, "w") as f:
+            f.write("%PDF " + self.string)
+
+def setup(tmp_path, monkeypatch):
+    pool = ThreadPoolExecutor(1)
+    monkeypatch.setattr(render_service, "HTML", FakeHTML)
+    monkeypatch.setattr(render_service, "RENDER_DIR", tmp_path / "renders")
+    monkeypatch.setattr(render_service, "_get_pool", lambda: pool)
+    monkeypatch.setattr(render_service, "_JOBS", {})
+    FakeHTML.gate.clear()
+    FakeHTML.calls = []
+    html = tmp_path / "report.html"
+    html.write_text("<p>v1</p>")
+    return html
+
+def wait_for_jobs():
+    for job in list(render_service._JOBS.values()):
+        job.exception()
+
+def test_snapshot_renders_in_background_and_is_cached_by_content(tmp_path, monkeypatch):
+    html = setup(tmp_path, monkeypatch)
+    assert render_service.snapshot("pdf", html)["status"] == "rendering"
+    assert render_service.snapshot("pdf", html)["status"] == "rendering"  # not queued twice
+    FakeHTML.gate.set()
+    wait_for_jobs()
+    ready = render_service.snapshot("pdf", html)
+    assert ready["status"] == "ready" and open(ready["path"]).read() == "%PDF <p>v1</p>"
+    assert FakeHTML.calls == ["<p>v1</p>"]
+    html.write_text("<p>v2</p>")
+    assert render_service.submit(html, ["pdf"])["pdf"]["digest"] != ready["digest"]
+    wait_for_jobs()
+
+class BrokenHTML(FakeHTML):
+    def write_pdf(self, target):
+        raise RuntimeError("layout failed")
+
+def test_failed_render_is_reported_without_retrying(tmp_path, monkeypatch):
+    html = setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(render_service, "HTML", BrokenHTML)
+    render_service.submit(html, ["pdf"])
+    wait_for_jobs()
+    status = render_service.snapshot("pdf", html)
+    assert status["status"] == "failed" and "layout failed" in status["error"]
+    assert len(render_service._JOBS) == 1
+
+def test_formats_weasyprint_cannot_write_are_never_queued(tmp_path, monkeypatch):
+    html = setup(tmp_path, monkeypatch)
+    FakeHTML.gate.set()
+    assert set(render_service.submit(html)) == {"pdf"}  # FakeHTML has no write_png, like weasyprint 53+
+    with pytest.raises(NotImplementedError):
+        render_service.snapshot("png", html)
+    assert [fmt for _, fmt in render_service._JOBS] == ["pdf"]
+    wait_for_jobs()
+
+def test_snapshot_source_is_the_full_report_with_event_rows(tmp_path, monkeypatch):
+    from app.services import reporting_service
+    from app.models.events import SecurityEvent
+    setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(reporting_service, "REPORT_DIR", tmp_path)
+    monkeypatch.setattr(render_service, "REPORT_DIR", tmp_path)
+    monkeypatch.setattr(render_service, "_SOURCE_DIGESTS", {})
+    event = SecurityEvent(page_url="https://a.com/login", https=False, num_links=1, num_forms=1,
+                          has_login_form=True, headers={})
+    reporting_service.generate(None, [{"event": event, "risk": 8.0, "pattern": "no_https"}])
+    FakeHTML.gate.set()
+    digest = render_service.submit(formats=["pdf"])["pdf"]["digest"]
+    wait_for_jobs()
+    assert '<tr class="high">' in FakeHTML.calls[0] and "<td>https://a.com/login</td>" in FakeHTML.calls[0]
+    assert render_service.snapshot("pdf")["digest"] == digest  # polling reuses the cached source digest
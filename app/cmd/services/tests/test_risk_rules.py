@@ -0,0 +1,171 @@
+# ===============================
+# Chapter 1: Unit Tests for risk_rules.py
+# ===============================
+import json
+import os
+import time
+from app.services import risk_rules
+from app.models.events import SecurityEvent
+
+def make_event(**overrides):
+    fields = dict(page_url="https://a.com", https=True, num_links=1, num_forms=0, has_login_form=False, headers={})
+    fields.update(overrides)
+    return SecurityEvent(**fields)
+
+def test_score_batch_rule_weights():
+    events = [
+        make_event(),
+        make_event(has_login_form=True),
+        make_event(page_url="http://b.com", https=False, has_login_form=True),
+        make_event(note="patient diagnosis attached"),
+    ]
+    risk, components = risk_rules.score_batch(events)
+    assert list(risk) == [0, 2, 5, 10]
+    assert list(components["phi_data"]) == [False, False, False, True]
+
+def test_score_matches_batch():
+    events = [make_event(has_login_form=True), make_event(note="card 4111111111111111")]
+    assert [r["risk"] for r in risk_rules.score(events)] == [2, 10]
+
+def test_match_rules_reports_each_rule():
+    text = "Patient SSN 123-45-6789, card 4111111111111111, routing 021000021, LAB Test Result"
+    assert risk_rules.match_rules(text) == {
+        "phi_patient": 1, "ssn": 1, "credit_card": 1, "bank_account": 1, "phi_lab": 1, "phi_test_result": 1,
+    }
+    assert risk_rules.match_rules("order 2024 at home") == {}
+
+def test_evaluate_event_is_cached_until_content_changes(monkeypatch):
+    event = make_event(note="patient chart")
+    calls = []
+    real_match = risk_rules.match_rules
+    monkeypatch.setattr(risk_rules, "match_rules", lambda text: calls.append(text) or real_match(text))
+    first = risk_rules.evaluate_event(event)
+    assert risk_rules.contains_phi_data(event) and not risk_rules.contains_financial_data(event)
+    risk_rules.score_batch([event])
+    assert len(calls) == 1
+    assert risk_rules.evaluate_event(event) is first
+
+    event.risk = 10  # scoring output, not content
+    assert risk_rules.evaluate_event(event) is first
+    event.note = "card 4111111111111111"
+    assert risk_rules.evaluate_event(event).categories == {"financial"}
+    assert len(calls) == 2
+
+def test_rule_engine_hot_reloads(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"max_risk": 10, "rules": [{"id": "login", "field": "has_login_form", "op": "eq", "value": true, "points": 4}]}')
+    engine = risk_rules.RuleEngine(path, check_seconds=0)
+    risk, fired = engine.plan().evaluate([make_event(has_login_form=True), make_event()])
+    assert list(risk) == [4, 0]
+    first_version = engine.plan().version
+
+    path.write_text('{"max_risk": 10, "rules": [{"id": "many_links", "field": "num_links", "op": "gt", "value": 0, "points": 1},'
+                    ' {"id": "phi", "category": "phi", "force": 9}]}')
+    os.utime(path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+    plan = engine.plan()
+    assert plan.version != first_version
+    assert [r.id for r in plan.rules] == ["many_links", "phi"]  # cheapest first
+    risk, fired = plan.evaluate([make_event(), make_event(note="patient")])
+    assert list(risk) == [1, 9]
+
+    path.write_text("{not json")
+    os.utime(path, ns=(time.time_ns() + 2 * 10**9, time.time_ns() + 2 * 10**9))
+    assert engine.plan() is plan  # broken edit keeps the last good plan
+    path.unlink()
+    assert engine.plan() is plan  # so does a deleted file
+
+def test_set_stats_rebuilds_plan_without_rereading_rulebook(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"rules": [{"id": "login", "field": "has_login_form", "op": "eq", "value": true, "points": 4}]}')
+    engine = risk_rules.RuleEngine(path, check_seconds=60)
+    plan = engine.plan()
+    path.write_text("{not json")
+    stats = risk_rules.RuleStats()
+    engine.set_stats(stats)
+    instrumented = engine.plan()
+    assert instrumented is not plan and instrumented.instrumented
+    assert instrumented.version == plan.version
+    risk, _ = instrumented.evaluate([make_event(has_login_form=True)])
+    assert list(risk) == [4] and stats.snapshot()["login"]["hits"] == 1
+    engine.set_stats(None)
+    assert not engine.plan().instrumented
+
+def test_field_rule_skips_none_values(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"rules": [{"id": "anomalous", "field": "anomaly_score", "op": "gt", "value": 0.5, "points": 3}]}')
+    plan = risk_rules.RuleEngine(path, check_seconds=0).plan()
+    risk, fired = plan.evaluate([make_event(anomaly_score=0.9), make_event(), make_event(anomaly_score=0.1)])
+    assert list(risk) == [3, 0, 0]
+
+def test_stream_scanner_handles_matches_across_chunks():
+    text = ("filler " * 30 + "patient ssn 123-45-6789 card 4111111111111111 ") * 20 + "12345678901234567890"
+    expected = risk_rules.match_rules(text)
+    for size in (1, 5, 17, 64, 1000):
+        scanner = risk_rules.StreamScanner()
+        for i in range(0, len(text), size):
+            scanner.feed(text[i:i + size])
+        counts, snippets = scanner.close()
+        assert counts == expected
+        assert len(snippets) == risk_rules.MAX_SNIPPETS
+        assert not any("4111111111111111" in s or "123-45-6789" in s for s in snippets)
+
+def test_body_matches_force_high_risk():
+    events = [make_event(body_matches={"ssn": 2}), make_event(), make_event(body_matches={"phi_patient": 1}),
+              make_event(body_matches={"phi_patient": 2, "phi_diagnosis": 1})]
+    risk, fired = risk_rules.score_batch(events)
+    assert list(risk) == [10, 0, 0, 10]
+    assert list(fired["body_financial_data"]) == [True, False, False, False]
+    assert list(fired["body_phi_data"]) == [False, False, False, True]
+
+def test_body_scanner_matches_whole_words_only():
+    scanner = risk_rules.StreamScanner()
+    scanner.feed("Tickets available; collaborate on the record label. Patient lab results.")
+    counts, _ = scanner.close()
+    assert counts == {"phi_record": 1, "phi_patient": 1, "phi_lab": 1}
+
+def test_parallel_scoring_keeps_event_order(monkeypatch):
+    monkeypatch.setattr(risk_rules, "PARALLEL_MIN_EVENTS", 20)
+    monkeypatch.setattr(risk_rules, "PARALLEL_SHARD_SIZE", 7)
+    monkeypatch.setattr(risk_rules, "RULE_WORKERS", 2)
+    variants = [make_event(), make_event(has_login_form=True), make_event(https=False), make_event(note="patient")]
+    events = [variants[i % 4] for i in range(30)]
+    try:
+        risk, fired = risk_rules.score_batch(events)
+        assert risk_rules._POOL is not None
+    finally:
+        risk_rules.shutdown_pool()
+    serial_risk, serial_fired = risk_rules.score_batch(events, parallel=False)
+    assert list(risk) == list(serial_risk)
+    assert {k: list(v) for k, v in fired.items()} == {k: list(v) for k, v in serial_fired.items()}
+
+def test_small_batches_stay_serial(monkeypatch):
+    monkeypatch.setattr(risk_rules, "PARALLEL_MIN_EVENTS", 20)
+    risk_rules.score_batch([make_event()] * 5)
+    assert risk_rules._POOL is None
+
+def test_financial_detection_on_labeled_corpus():
+    corpus_path = os.path.join(os.path.dirname(__file__), "data", "financial_corpus.jsonl")
+    with open(corpus_path) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    for item in corpus:
+        found = {rule for rule in risk_rules.match_rules(item["text"]) if risk_rules.RULE_CATEGORY[rule] == "financial"}
+        assert found == set(item["labels"]), item["text"]
+
+def test_rule_stats_only_count_while_enabled():
+    events = [make_event(has_login_form=True), make_event(https=False), make_event(note="patient")]
+    try:
+        risk_rules.set_rule_stats(False, reset=True)
+        risk_rules.score_batch(events)
+        assert risk_rules.rule_stats()["rules"] == {}
+        assert not risk_rules.ENGINE.plan().instrumented
+
+        risk_rules.set_rule_stats(True)
+        risk, _ = risk_rules.score_batch(events)
+        stats = risk_rules.rule_stats()
+        assert stats["enabled"] and list(risk) == [2, 3, 10]
+        assert stats["rules"]["login_form"]["invocations"] == 3
+        assert stats["rules"]["login_form"]["hits"] == 1
+        assert stats["rules"]["phi_data"]["hits"] == 1
+        assert stats["rules"]["phi_data"]["seconds"] >= 0
+    finally:
+        risk_rules.set_rule_stats(False, reset=True)
@@ -0,0 +1,85 @@
+# ===============================
+# Chapter 1: Unit Tests for scoring_service.py
+# ===============================
+from app.services import cache_service, learning_service, risk_rules, scoring_service
+from app.models.events import SecurityEvent
+
+def make_events():
+    return [
+        SecurityEvent(page_url="https://a.com", https=True, num_links=5, num_forms=1, has_login_form=False, headers={}),
+        SecurityEvent(page_url="http://b.com", https=False, num_links=2, num_forms=0, has_login_form=True, headers={}),
+    ]
+
+def test_score_events_without_model_uses_rules_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_service, "SCORE_CACHE_PATH", tmp_path / "cache.sqlite")
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "missing.pkl")
+    rows = scoring_service.score_events(make_events())
+    assert [r["risk"] for r in rows] == [0, 5]
+    assert rows[1]["pattern"] == "login_form+no_https"
+    assert rows[0]["pattern"] == "N/A"
+    assert rows[1]["components"]["anomaly"] is None
+
+def test_score_events_adds_weighted_anomaly(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_service, "SCORE_CACHE_PATH", tmp_path / "cache.sqlite")
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    events = make_events() * 10
+    learning_service.train(events)
+    rows = scoring_service.score_events(events)
+    assert len(rows) == 20
+    for row in rows:
+        c = row["components"]
+        assert 0 <= c["anomaly"] <= 1
+        expected = min(c["rule_risk"] + float(scoring_service.ml_points(c["anomaly"])), 10)
+        assert abs(row["risk"] - expected) <= 0.01
+
+def test_typical_events_without_rule_hits_stay_low(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_service, "SCORE_CACHE_ENABLED", False)
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    events = [SecurityEvent(page_url=f"https://a.com/{i}", https=True, num_links=5 + i % 7, num_forms=i % 2,
+                            has_login_form=False, headers={}) for i in range(200)]
+    learning_service.train(events)
+    rows = scoring_service.score_events(events)
+    assert all(r["components"]["rule_risk"] == 0 for r in rows)
+    assert sum(r["risk"] < 4 for r in rows) >= 0.9 * len(rows)  # only the anomalous tail can rise
+    assert scoring_service.ml_points(0.5) == 0 and scoring_service.ml_points(1.0) == scoring_service.ML_RISK_WEIGHT
+
+def test_unchanged_events_come_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_service, "SCORE_CACHE_PATH", tmp_path / "cache.sqlite")
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "isoforest.pkl")
+    calls = []
+    original = risk_rules.score_batch
+    monkeypatch.setattr(risk_rules, "score_batch", lambda evs: calls.append(len(evs)) or original(evs))
+    first = scoring_service.score_events(make_events())
+    recrawled = make_events()  # new timestamps, same content
+    recrawled.append(SecurityEvent(page_url="https://c.com", https=True, num_links=1, num_forms=0,
+                                   has_login_form=True, headers={}))
+    second = scoring_service.score_events(recrawled)
+    assert calls == [2, 1]
+    assert [r["risk"] for r in second[:2]] == [r["risk"] for r in first]
+    assert second[2]["event"] is recrawled[2] and second[2]["risk"] == 2
+
+    learning_service.train(make_events() * 10)  # new model version: everything is rescored
+    scoring_service.score_events(recrawled)
+    assert calls[-1] == 3
+
+def test_score_stream_matches_batch_scoring(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_service, "SCORE_CACHE_PATH", tmp_path / "cache.sqlite")
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "missing.pkl")
+    events = make_events() * 3
+    streamed = scoring_service.score_stream(iter([events[:4], events[4:]]))
+    assert [r["risk"] for r in streamed] == [r["risk"] for r in scoring_service.score_events(events)]
+
+def test_offloaded_stream_keeps_order_and_merges_rule_stats(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(cache_service, "SCORE_CACHE_ENABLED", False)
+    monkeypatch.setattr(learning_service, "MODEL_PATH", tmp_path / "missing.pkl")
+    events = make_events() * 3
+    expected = [r["risk"] for r in scoring_service.score_events(events)]
+    try:
+        risk_rules.set_rule_stats(True, reset=True)
+        with ThreadPoolExecutor(2) as pool:
+            streamed = scoring_service.score_stream_offloaded(iter([events[:1], events[1:4], events[4:]]), pool.submit)
+            assert [r["risk"] for r in streamed] == expected
+        assert risk_rules.rule_stats()["rules"]["login_form"]["invocations"] == 6
+    finally:
+        risk_rules.set_rule_stats(False, reset=True)
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.utils.executors import BoundedExecutor, Saturated
+
+
+def make_executor(workers=1, queue=1):
+    return BoundedExecutor("test", lambda: ThreadPoolExecutor(workers), workers, queue)
+
+
+def test_submit_refuses_work_beyond_workers_plus_queue():
+    executor = make_executor(workers=1, queue=1)
+    gate = threading.Event()
+    running = executor.submit(gate.wait, 5)
+    queued = executor.submit(lambda: "queued")
+    with pytest.raises(Saturated):
+        executor.submit(lambda: "refused")
+    assert executor.stats()["pending"] == 2 and executor.stats()["rejected"] == 1
+
+    gate.set()
+    running.result()
+    assert queued.result() == "queued"
+    assert executor.submit(lambda: "admitted again").result() == "admitted again"
+    executor.shutdown()
+
+
+def test_run_awaits_the_result_and_releases_the_slot():
+    executor = make_executor(workers=1, queue=0)
+    assert asyncio.run(executor.run(sum, [1, 2, 3])) == 6
+    assert executor.stats()["pending"] == 0
+    executor.shutdown()
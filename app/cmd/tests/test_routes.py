@@ -71,3 +71,118 @@ def test_report_endpoints_generate_files(tmp_path, monkeypatch, endpoint, filena
     file_path = tmp_path / filename
     assert file_path.exists()
     assert file_path.stat().st_size > 0
+
+
+# ------------------------
+# Conditional and partial report downloads
+# ------------------------
+def test_report_download_revalidates_with_etag():
+    first = client.get("/api/report/latest/csv", headers={**HEADERS, "Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and "last-modified" in first.headers and "cache-control" in first.headers
+
+    again = client.get("/api/report/latest/csv",
+                       headers={**HEADERS, "Accept-Encoding": "identity", "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b"" and again.headers["etag"] == etag
+
+    since = client.get("/api/report/latest/csv", headers={
+        **HEADERS, "Accept-Encoding": "identity", "If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+
+
+def test_report_download_supports_range():
+    full = client.get("/api/report/latest/csv", headers={**HEADERS, "Accept-Encoding": "identity"})
+    part = client.get("/api/report/latest/csv",
+                      headers={**HEADERS, "Accept-Encoding": "identity", "Range": "bytes=0-9"})
+    assert part.status_code == 206
+    assert part.content == full.content[:10]
+    stale = client.get("/api/report/latest/csv", headers={
+        **HEADERS, "Accept-Encoding": "identity", "Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == full.content
+
+
+def test_latest_json_serves_the_format_last_generated(tmp_path, monkeypatch):
+    from app import routes
+    (tmp_path / "report.json").write_text("[]")
+    (tmp_path / "report.ndjson").write_text('{"page_url": "https://a.com"}\n')
+    monkeypatch.setattr(routes, "reports_dir", tmp_path)
+    monkeypatch.setattr(routes, "_SAMPLES_READY", True)
+    monkeypatch.setattr(routes, "load_rollup", lambda: {"json_file": "report.ndjson"})
+    response = client.get("/api/report/latest/json", headers={**HEADERS, "Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.text == '{"page_url": "https://a.com"}\n'
+
+    monkeypatch.setattr(routes, "load_rollup", lambda: {"json_file": "report.json"})
+    response = client.get("/api/report/latest/json", headers={**HEADERS, "Accept-Encoding": "identity"})
+    assert response.headers["content-type"].startswith("application/json") and response.text == "[]"
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip", True),
+    ("deflate, gzip;q=0.5", True),
+    ("*;q=1, gzip;q=0", False),
+    ("gzip;q=0.000, *", False),
+    ("*", True),
+    ("br, *;q=0", False),
+    ("identity", False),
+    ("GZIP ; q=0.8", True),
+])
+def test_accepts_gzip_parses_every_coding(accept, expected):
+    from starlette.requests import Request
+    from app import routes
+    request = Request({"type": "http", "headers": [(b"accept-encoding", accept.encode())]})
+    assert routes._accepts_gzip(request) is expected
+
+
+# ------------------------
+# Backpressure
+# ------------------------
+def test_saturated_executor_answers_429(monkeypatch):
+    from app.utils import executors
+    monkeypatch.setattr(executors.IO, "limit", 0)
+    response = client.get("/api/report/latest/csv", headers=HEADERS)
+    assert response.status_code == 429
+    assert "retry-after" in response.headers
+
+
+# ------------------------
+# /livez and /readyz probes
+# ------------------------
+def test_probes_answer_from_cached_state(monkeypatch):
+    from app.services import health_service
+    assert client.get("/livez").json() == {"status": "ok"}
+
+    health_service.refresh()
+    ready = client.get("/readyz")
+    assert ready.status_code == 200 and ready.json()["status"] == "ready"
+
+    # No disk access on the probe path: a failing check only shows up after the next refresh
+    monkeypatch.setitem(health_service.STATE, "checks", {**health_service.STATE["checks"],
+                                                        "event_store": {"ok": False, "error": "unreachable"}})
+    unready = client.get("/readyz")
+    assert unready.status_code == 503 and unready.json()["checks"]["event_store"]["ok"] is False
+
+    monkeypatch.setitem(health_service.STATE, "checked_at", 0)
+    health_service.refresh()
+    assert client.get("/readyz").status_code == 200
+
+
+def test_health_refresh_runs_while_io_is_saturated(monkeypatch):
+    import asyncio
+    from app.services import health_service
+    from app.utils import executors
+    monkeypatch.setattr(executors.IO, "limit", 0)
+    monkeypatch.setattr(health_service, "HEALTH_REFRESH_SECONDS", 0.01)
+
+    async def run():
+        health_service.start()
+        first = health_service.STATE["checked_at"]
+        await asyncio.sleep(0.3)
+        health_service.stop()
+        return first, health_service.STATE["checked_at"]
+
+    first, last = asyncio.run(run())
+    assert last > first
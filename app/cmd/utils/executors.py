@@ -0,0 +1,94 @@
+# ===============================
+# Chapter 1: Imports and Setup
+# ===============================
+# This chapter sets up the executors that keep blocking work off the event loop. Each one caps
+# how much work may wait for it; past that cap, submit() raises Saturated and the API answers
+# 429 instead of queueing requests it cannot serve in time.
+import os, asyncio, multiprocessing, threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Crawling (network), event store / report files (disk)
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+IO_QUEUE_DEPTH = int(os.getenv("IO_QUEUE_DEPTH", "32"))
+# Model training and other CPU-bound jobs; processes, so they never hold the API's GIL
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+CPU_QUEUE_DEPTH = int(os.getenv("CPU_QUEUE_DEPTH", "4"))
+SATURATED_RETRY_AFTER = int(os.getenv("SATURATED_RETRY_AFTER", "5"))   # seconds, sent with 429
+
+class Saturated(Exception):
+    """Raised by BoundedExecutor.submit when every worker is busy and the queue is full."""
+
+    def __init__(self, name: str, limit: int):
+        super().__init__(f"{name} executor is saturated ({limit} jobs running or queued); retry shortly.")
+        self.name = name
+        self.limit = limit
+
+# ===============================
+# Chapter 2: Bounded Executors
+# ===============================
+class BoundedExecutor:
+    """
+    Developer Note: Wraps a thread or process pool and admits at most max_workers + max_queue
+    jobs at a time (running plus waiting). The pool is created on first use, so importing this
+    module never spawns workers.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Executor], max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.limit = max_workers + max_queue
+        self.pending = 0
+        self.rejected = 0
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _release(self, _: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        with self._lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                raise Saturated(self.name, self.limit)
+            self.pending += 1
+            if self._executor is None:
+                self._executor = self._factory()
+            executor = self._executor
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Developer Note: Awaitable submit(); raises Saturated straight away rather than waiting for a slot."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.max_workers, "queue_depth": self.max_queue, "pending": self.pending,
+                "rejected": self.rejected}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+# spawn, not fork: the API process runs threads, and forking those is not safe
+IO = BoundedExecutor("io", lambda: ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="sea-io"),
+                     IO_WORKERS, IO_QUEUE_DEPTH)
+CPU = BoundedExecutor("cpu", lambda: ProcessPoolExecutor(CPU_WORKERS, mp_context=multiprocessing.get_context("spawn")),
+                      CPU_WORKERS, CPU_QUEUE_DEPTH)
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {executor.name: executor.stats() for executor in (IO, CPU)}
+
+def shutdown_executors() -> None:
+    IO.shutdown()
+    CPU.shutdown()
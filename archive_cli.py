@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+archive_cli.py – Inspect and prune the content-addressed report archive (reports/archive).
+
+Usage:
+  ./archive_cli.py list
+  ./archive_cli.py show 20251019_101500
+  ./archive_cli.py gc --keep 30 [--dry-run]
+  ./archive_cli.py import-legacy [--remove]
+"""
+
+import argparse
+import json
+import sys
+
+from app.services import archive_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SEA-SEQ report archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List archived runs from the index")
+    show = sub.add_parser("show", help="Print a run's manifest")
+    show.add_argument("run_id")
+    gc = sub.add_parser("gc", help="Keep the newest runs and delete unreferenced blobs")
+    gc.add_argument("--keep", type=int, required=True, help="Number of newest runs to keep")
+    gc.add_argument("--dry-run", action="store_true", help="Report what would be removed")
+    legacy = sub.add_parser("import-legacy", help="Convert old full-copy run folders to manifests")
+    legacy.add_argument("--remove", action="store_true", help="Delete each folder once imported")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        index = archive_service.load_index()
+        for run_id, run in sorted(index["runs"].items()):
+            latest = "  (latest report)" if run_id == index["latest_report"] else ""
+            print(f"{run_id}  {run['created']}  {run['files']} files  {run['bytes']} bytes{latest}")
+    elif args.command == "show":
+        try:
+            print(json.dumps(archive_service.load_manifest(args.run_id), indent=2))
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 1
+    elif args.command == "gc":
+        print(json.dumps(archive_service.gc(args.keep, dry_run=args.dry_run), indent=2))
+    elif args.command == "import-legacy":
+        imported = archive_service.import_legacy(remove=args.remove)
+        print(f"Imported {len(imported)} run(s): {', '.join(imported) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
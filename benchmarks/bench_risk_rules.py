@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+bench_risk_rules.py – Compare the single-pass sensitive-data matcher with the
+original one-regex-per-pattern + substring-per-keyword scan on large texts,
+the compiled rulebook plan with a hand-written per-event scoring loop, and
+financial-rule precision on the labeled test corpus.
+
+Run from the repo root:  python benchmarks/bench_risk_rules.py [--mb 4] [--events 50000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import re
+import sys
+import time
+
+from pydantic import BaseModel, PrivateAttr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import risk_rules  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "app", "cmd", "services", "tests", "data", "financial_corpus.jsonl")
+NUMBERS = ["1700000000000", "123456789", "987654321", "1234567890123456", "555-123-4567", "2024-10-19"]
+WORDS = ["alpha", "order", "page", "link", "form", "user", "home", "about", "contact",
+         "2024", "12345", "checkout", "search", "profile", "settings", "help"]
+
+
+def legacy_financial(text):
+    return any(p.search(text) for p in risk_rules.FINANCIAL_PATTERNS)
+
+
+def legacy_phi(text):
+    lower = text.lower()
+    return any(keyword in lower for keyword in risk_rules.PHI_KEYWORDS)
+
+
+def legacy_scan(text):
+    """The pre-matcher implementation: three regex scans plus nine substring scans."""
+    return legacy_financial(text), legacy_phi(text)
+
+
+def legacy_rules(text):
+    """Per-rule attribution the old way: every pattern and keyword scanned to the end."""
+    hits = {}
+    for rule, pattern in zip(risk_rules.FINANCIAL_RULES, risk_rules.FINANCIAL_PATTERNS):
+        count = len(pattern.findall(text))
+        if count:
+            hits[rule] = count
+    lower = text.lower()
+    for rule, keyword in risk_rules.PHI_RULES.items():
+        count = lower.count(keyword)
+        if count:
+            hits[rule] = count
+    return set(hits)
+
+
+def matcher_rules(text):
+    return set(risk_rules.match_rules(text))
+
+
+def matcher_scan(text):
+    categories = risk_rules.scan_categories(text)
+    return "financial" in categories, "phi" in categories
+
+
+def legacy_financial_rules(text):
+    """Financial rules the old way: any digit run of the right shape counts."""
+    return {rule for rule, pattern in zip(risk_rules.FINANCIAL_RULES, risk_rules.FINANCIAL_PATTERNS)
+            if pattern.search(text)}
+
+
+def validated_financial_rules(text):
+    return {rule for rule in risk_rules.match_rules(text) if risk_rules.RULE_CATEGORY[rule] == "financial"}
+
+
+def precision_recall(fn, corpus):
+    tp = fp = fn_ = 0
+    for item in corpus:
+        found, expected = fn(item["text"]), set(item["labels"])
+        tp += len(found & expected)
+        fp += len(found - expected)
+        fn_ += len(expected - found)
+    return tp / max(tp + fp, 1), tp / max(tp + fn_, 1), fp
+
+
+def original_score(events):
+    """risk_rules.score before the rulebook: every contains_* call re-serializes and re-scans."""
+    def text(event):
+        return " ".join(str(v) for v in event.model_dump().values())
+
+    out = []
+    for event in events:
+        risk = 0
+        if event.has_login_form:
+            risk += 2
+        if not event.https:
+            risk += 3
+        if legacy_financial(text(event)):
+            risk += 5
+        if legacy_phi(text(event)):
+            risk += 5
+        risk = min(risk, 10)
+        if legacy_financial(text(event)) or legacy_phi(text(event)):
+            risk = 10
+        out.append(risk)
+    return out
+
+
+def handwritten_score(events):
+    """The same hard-coded rules as a plain loop over the cached per-event evaluation."""
+    out = []
+    for event in events:
+        if risk_rules.evaluate_event(event).categories:
+            out.append(10)
+        else:
+            out.append(min(2 * bool(event.has_login_form) + 3 * (event.https is False), 10))
+    return out
+
+
+class BenchEvent(BaseModel):
+    """Stand-in for SecurityEvent (same fields the rules read, same cache slot)."""
+    page_url: str
+    https: bool
+    num_links: int
+    num_forms: int
+    has_login_form: bool
+    note: str = ""
+    _rule_context: object = PrivateAttr(default=None)
+
+
+def make_events(count, rng):
+    return [BenchEvent(page_url=f"https://example.com/{i}", https=rng.random() < 0.8,
+                            num_links=rng.randint(0, 80), num_forms=rng.randint(0, 3),
+                            has_login_form=rng.random() < 0.2,
+                            note=make_text(200, ["patient", "123-45-6789"], rng))
+            for i in range(count)]
+
+
+def make_text(size, needles, rng):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        if needles and rng.random() < 0.001:
+            word = rng.choice(needles)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def bench(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=float, default=4.0, help="size of each synthetic text in MB")
+    parser.add_argument("--events", type=int, default=50000, help="events for the rulebook comparison")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    size = int(args.mb * 1024 * 1024)
+    corpora = {
+        "clean": make_text(size, [], rng),
+        "phi-late": make_text(size, [], rng) + " patient",
+        "sparse-hits": make_text(size, ["Patient", "123-45-6789", "4111111111111111", "lab"], rng),
+    }
+    for title, legacy_fn, matcher_fn in [
+        ("yes/no per category (legacy short-circuits on first hit)", legacy_scan, matcher_scan),
+        ("which rules fired", legacy_rules, matcher_rules),
+    ]:
+        print(title)
+        print(f"  {'corpus':<12} {'legacy s':>9} {'matcher s':>10} {'speedup':>8}  same-result")
+        for name, text in corpora.items():
+            legacy_t, legacy_r = bench(legacy_fn, text, args.repeat)
+            matcher_t, matcher_r = bench(matcher_fn, text, args.repeat)
+            print(f"  {name:<12} {legacy_t:>9.3f} {matcher_t:>10.3f} {legacy_t / matcher_t:>7.2f}x  {legacy_r == matcher_r}")
+    # Event-sized texts: per-call overhead dominates, 12 scans vs one
+    small = [make_text(300, ["patient", "123456789"], rng) for _ in range(20000)]
+    legacy_t, _ = bench(lambda texts: [legacy_rules(t) for t in texts], small, args.repeat)
+    matcher_t, _ = bench(lambda texts: [matcher_rules(t) for t in texts], small, args.repeat)
+    print(f"20k event-sized texts, which rules fired: legacy {legacy_t:.3f}s, matcher {matcher_t:.3f}s "
+          f"({legacy_t / matcher_t:.2f}x)")
+    hits = risk_rules.match_rules(corpora["sparse-hits"])
+    print("rules fired (sparse-hits):", dict(sorted(hits.items())))
+
+    # Rulebook plan vs hand-written loop. "cold" rebuilds the events before every run so the
+    # per-event rule cache starts empty; "warm" rescores the same, already-evaluated events.
+    plan = risk_rules.ENGINE.plan()
+    contenders = [("original loop", original_score), ("hand-written", handwritten_score),
+                  ("rulebook plan", lambda evs: list(plan.evaluate(evs)[0]))]
+    for label, cold in (("cold cache", True), ("warm cache", False)):
+        warm_events = make_events(args.events, random.Random(7))
+        handwritten_score(warm_events)
+        timings = []
+        for _, fn in contenders:
+            best = float("inf")
+            for _ in range(args.repeat):
+                events = make_events(args.events, random.Random(7)) if cold else warm_events
+                gc.collect()
+                started = time.perf_counter()
+                result = fn(events)
+                best = min(best, time.perf_counter() - started)
+            timings.append((best, result))
+        plan_t, plan_r = timings[-1]
+        line = ", ".join(f"{name} {t:.3f}s ({t / plan_t:.2f}x, same={r == plan_r})"
+                         for (name, _), (t, r) in zip(contenders[:-1], timings[:-1]))
+        print(f"{args.events} events, {label}: rulebook plan {plan_t:.3f}s vs {line}")
+
+    # Financial precision on the labeled corpus, then throughput on number-heavy and digit-free
+    # event texts: the first pays for validation, the second should skip the financial branches.
+    with open(CORPUS_PATH) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    print(f"financial rules on {len(corpus)} labeled texts:")
+    for name, fn in (("legacy", legacy_financial_rules), ("validated", validated_financial_rules)):
+        precision, recall, fp = precision_recall(fn, corpus)
+        print(f"  {name:<10} precision {precision:.2f}  recall {recall:.2f}  false positives {fp}")
+    texts = {
+        "number-heavy": [make_text(300, NUMBERS, rng).replace("12345", rng.choice(NUMBERS)) for _ in range(20000)],
+        "digit-free": [make_text(300, [], rng).replace("2024", "blog").replace("12345", "posts") for _ in range(20000)],
+    }
+    for name, batch in texts.items():
+        legacy_t, _ = bench(lambda ts: [legacy_financial_rules(t) for t in ts], batch, args.repeat)
+        matcher_t, _ = bench(lambda ts: [matcher_rules(t) for t in ts], batch, args.repeat)
+        print(f"20k {name} texts: legacy financial only {legacy_t:.3f}s, validated matcher (all rules) "
+              f"{matcher_t:.3f}s ({legacy_t / matcher_t:.2f}x)")
+
+    # Digit prefilter candidate: a precompiled search for nine digits in a row or the SSN shape
+    # (every financial match contains one) that falls back to the keyword-only matcher when it
+    # finds none. "event-like" texts carry short numbers (years, ids) but no nine-digit run.
+    prefilter = re.compile(r"\d{9}|\d{3}-\d{2}-\d{4}")
+    keywords_only = risk_rules._compile_matcher(financial=False)
+
+    def prefiltered_rules(text):
+        lower = text.lower()
+        matcher = risk_rules.SENSITIVE_MATCHER if prefilter.search(lower) else keywords_only
+        return {m.lastgroup for m in matcher.finditer(lower) if risk_rules._is_valid(m)}
+
+    texts["event-like"] = [make_text(300, ["patient"], rng) for _ in range(20000)]
+    print("digit prefilter:")
+    for name, batch in texts.items():
+        full_t, full_r = bench(lambda ts: [matcher_rules(t) for t in ts], batch, args.repeat)
+        pre_t, pre_r = bench(lambda ts: [prefiltered_rules(t) for t in ts], batch, args.repeat)
+        print(f"  20k {name:<12} combined matcher {full_t:.3f}s, prefilter + matcher {pre_t:.3f}s "
+              f"({full_t / pre_t:.2f}x, same={full_r == pre_r})")
+
+if __name__ == "__main__":
+    main()
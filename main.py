@@ -1,12 +1,15 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 import os
 import logging
 import json
 import sys
 
 # Import the router and service
-from app.routes import router as api_router
+from app.routes import router as api_router, probe_router
 from app.services.data_service import set_target_site
+from app.services import health_service, learning_service, reporting_service
+from app.utils.executors import Saturated, shutdown_executors, SATURATED_RETRY_AFTER
 
 # -------------------------------------------------
 # JSON Logging for Docker
@@ -33,8 +36,7 @@ logger.propagate = False
 # App Factory
 # -------------------------------------------------
 def create_app() -> FastAPI:
-    reports_dir = "data/reports/latest"
-    os.makedirs(reports_dir, exist_ok=True)
+    reports_dir = reporting_service.REPORT_DIR  # created on import; /report/latest/* serves from here
 
     app = FastAPI(
         title="SEA-SEC API",
@@ -43,6 +45,14 @@ def create_app() -> FastAPI:
     )
 
     app.include_router(api_router, prefix="/api")
+    app.include_router(probe_router)
+
+    # A full executor queue means the work would wait too long: tell the client to back off
+    @app.exception_handler(Saturated)
+    async def saturated_handler(request: Request, exc: Saturated):
+        logger.warning(str(exc))
+        return JSONResponse(status_code=429, content={"detail": str(exc)},
+                            headers={"Retry-After": str(SATURATED_RETRY_AFTER)})
 
     # Startup event hook
     @app.on_event("startup")
@@ -60,9 +70,25 @@ def create_app() -> FastAPI:
         else:
             logger.info("ℹ️ No TARGET_SITE env var provided — call /api/set_site manually.")
 
+        # Compile the report template now so report requests never pay for it
+        logger.info(f"Report template compiled in {reporting_service.warm_templates():.3f}s")
+
+        # Load + warm the model now so the first scoring request does not pay for it
+        try:
+            stats = learning_service.warm_up()
+            logger.info(f"Model warmed: load {stats['load_seconds']:.3f}s, first score {stats['warmup_seconds']:.3f}s")
+        except FileNotFoundError:
+            logger.info("No trained model yet — call /api/learn/train.")
+
+        # Probe state: checked once now, then refreshed in the background
+        health_service.start()
+        logger.info(f"Health checks refresh every {health_service.HEALTH_REFRESH_SECONDS:g}s; probes at /livez, /readyz")
+
     # Shutdown event hook
     @app.on_event("shutdown")
     async def shutdown_event():
+        health_service.stop()
+        shutdown_executors()
         logger.info("SEA-SEC API shutting down... Goodbye!")
 
     return app
@@ -73,7 +99,7 @@ def create_app() -> FastAPI:
 app = create_app()
 
 # Run with:
-command: uvicorn main:api --host 0.0.0.0 --port 8000
+# uvicorn main:app --host 0.0.0.0 --port 8000
 
 # or for development with auto-reload:
 # uvicorn main:app --host   
\ No newline at end of file
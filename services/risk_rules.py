@@ -1,14 +1,29 @@
+import atexit
+import hashlib
+import json
+import logging
+import multiprocessing
+import operator
+import os
 import re
-from typing import Any
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 # ======================
 # Regex patterns
 # ======================
-FINANCIAL_PATTERNS = [
-    re.compile(r"\b\d{13,16}\b"),              # Credit card (basic)
-    re.compile(r"\b\d{3}-\d{2}-\d{4}\b"),      # SSN (US format)
-    re.compile(r"\b\d{9}\b"),                  # Bank account (generic 9 digits)
-]
+# Rule id -> pattern; every rule is matched with word boundaries on both sides
+FINANCIAL_RULES = {
+    "credit_card": r"\d{13,16}",               # Credit card (basic)
+    "ssn": r"\d{3}-\d{2}-\d{4}",              # SSN (US format)
+    "bank_account": r"\d{9}",                  # Bank account (generic 9 digits)
+}
+FINANCIAL_PATTERNS = [re.compile(rf"\b{p}\b") for p in FINANCIAL_RULES.values()]
 
 PHI_KEYWORDS = [
     "patient",
@@ -21,33 +36,252 @@ PHI_KEYWORDS = [
     "lab",
     "test result",
 ]
+# Rule id per keyword, e.g. "test result" -> "phi_test_result"
+PHI_RULES = {"phi_" + re.sub(r"\W", "_", keyword): keyword for keyword in PHI_KEYWORDS}
+
+RULE_CATEGORY = {**{rule: "financial" for rule in FINANCIAL_RULES}, **{rule: "phi" for rule in PHI_RULES}}
+
+
+def _compile_matcher(whole_words: bool = False, financial: bool = True) -> "re.Pattern":
+    """
+    Build one alternation over every financial pattern and PHI keyword, one named group per rule.
+    Keywords are grouped by first letter so each position tries one branch per letter, not one
+    per keyword, and the leading lookahead hands re a first-character set to skip on in C.
+    Only complete digit runs of a financial shape reach VALIDATORS. There is no separate digit
+    prefilter: benchmarks/bench_risk_rules.py compares one (a nine-digit / SSN-shape search that
+    picks the financial=False matcher) and the extra search costs more than it saves.
+    whole_words=True also puts word boundaries around the keywords (page bodies, where
+    "available" or "collaborate" would otherwise count as PHI).
+    """
+    by_first: Dict[str, List[str]] = {}
+    for rule, keyword in PHI_RULES.items():
+        by_first.setdefault(keyword[0], []).append(f"(?P<{rule}>{re.escape(keyword[1:])})")
+    phi = "|".join(f"{re.escape(first)}(?:{'|'.join(rest)})" for first, rest in sorted(by_first.items()))
+    first_chars = "".join(re.escape(first) for first in sorted(by_first))
+    if whole_words:
+        phi = rf"\b(?:{phi})\b"
+    if not financial:
+        return re.compile(rf"(?=[{first_chars}]){phi}")
+    financial = "|".join(f"(?P<{rule}>{pattern})" for rule, pattern in FINANCIAL_RULES.items())
+    return re.compile(rf"(?=[\d{first_chars}])(?:\b(?:{financial})\b|{phi})")
+
+
+SENSITIVE_MATCHER = _compile_matcher()
+BODY_MATCHER = _compile_matcher(whole_words=True)
+
+
+# ======================
+# Financial validators
+# ======================
+# The patterns only find digit runs of the right shape; these reject runs that cannot be the real thing
+# (timestamps, order ids, phone fragments), so a stray number no longer forces risk to 10.
+_CARD_PREFIX = re.compile(r"4|5[1-5]|2[2-7]|3[47]|3(?:0[0-5]|[68])|6(?:011|5|4[4-9])")
+_ROUTING_PREFIX = re.compile(r"0\d|1[0-2]|2[1-9]|3[0-2]|6[1-9]|7[0-2]|80")
+
+
+def _luhn_ok(digits: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = ord(ch) - 48
+        if i % 2:
+            d = d * 2 - 9 if d > 4 else d * 2
+        total += d
+    return total % 10 == 0
+
+
+def valid_card(candidate: str) -> bool:
+    """Known issuer prefix (Visa, Mastercard, Amex, Diners, Discover) and a passing Luhn checksum."""
+    return bool(_CARD_PREFIX.match(candidate)) and _luhn_ok(candidate)
+
+
+def valid_ssn(candidate: str) -> bool:
+    """SSA rules: area not 000, 666 or 9xx; group not 00; serial not 0000."""
+    area, group, serial = candidate.split("-")
+    return area not in ("000", "666") and area[0] != "9" and group != "00" and serial != "0000"
+
+
+def valid_routing_number(candidate: str) -> bool:
+    """ABA routing number: Federal Reserve prefix and the 3-7-1 weighted checksum."""
+    if not _ROUTING_PREFIX.match(candidate):
+        return False
+    d = [ord(ch) - 48 for ch in candidate]
+    return (3 * (d[0] + d[3] + d[6]) + 7 * (d[1] + d[4] + d[7]) + d[2] + d[5] + d[8]) % 10 == 0
+
+
+VALIDATORS: Dict[str, Callable[[str], bool]] = {
+    "credit_card": valid_card,
+    "ssn": valid_ssn,
+    "bank_account": valid_routing_number,
+}
+
+
+def _is_valid(m: "re.Match") -> bool:
+    check = VALIDATORS.get(m.lastgroup)
+    return check is None or check(m.group())
+
+
+def _valid_matches(text: str) -> Iterator["re.Match"]:
+    for m in SENSITIVE_MATCHER.finditer(text):
+        if _is_valid(m):
+            yield m
 
 
 # ======================
 # Detection helpers
 # ======================
+def match_rules(text: str) -> Dict[str, int]:
+    """
+    Scan text once and count hits per rule id (non-overlapping, leftmost first).
+    Keywords are matched case-insensitively as substrings, like the old `keyword in text` check;
+    financial candidates only count if they pass their validator.
+    """
+    hits: Dict[str, int] = {}
+    for m in _valid_matches(text.lower()):
+        hits[m.lastgroup] = hits.get(m.lastgroup, 0) + 1
+    return hits
+
+
+def scan_categories(text: str) -> set:
+    """
+    Same single pass as match_rules, but stops as soon as every category has fired.
+    """
+    found = set()
+    for m in _valid_matches(text.lower()):
+        found.add(RULE_CATEGORY[m.lastgroup])
+        if len(found) == 2:
+            break
+    return found
+
+
+# ======================
+# Streaming body scanner
+# ======================
+STREAM_OVERLAP = 64     # longer than any rule match, so a match cut by a chunk edge is seen whole next time
+MAX_SNIPPETS = 5
+SNIPPET_CONTEXT = 20
+_DIGIT = re.compile(r"\d")
+
+
+def _redact(text: str, keep_last: int = 0) -> str:
+    """Mask digits; optionally keep the last few (e.g. card/SSN last four)."""
+    if keep_last:
+        head, tail = text[:-keep_last], text[-keep_last:]
+        return _DIGIT.sub("*", head) + tail
+    return _DIGIT.sub("*", text)
+
+
+class StreamScanner:
+    """
+    Runs the sensitive-data matcher over text that arrives in chunks (e.g. the visible text of
+    a streamed response body), carrying only about STREAM_OVERLAP characters from one chunk to the next.
+    Uses BODY_MATCHER (whole-word keywords) unless another matcher is passed.
+    Matches that end inside the last STREAM_OVERLAP characters are deferred to the next
+    chunk, so one split across a boundary is counted once. Keeps hit counts per rule id
+    and up to MAX_SNIPPETS redacted snippets; the text itself is never stored.
+    """
+
+    def __init__(self, max_snippets: int = MAX_SNIPPETS, matcher: "re.Pattern" = BODY_MATCHER):
+        self.matcher = matcher
+        self.counts: Dict[str, int] = {}
+        self.snippets: List[str] = []
+        self.max_snippets = max_snippets
+        self._tail = ""
+        self._pos = 0
+
+    def feed(self, chunk: str) -> None:
+        self._scan(self._tail + chunk.lower(), final=False)
+
+    def close(self) -> Tuple[Dict[str, int], List[str]]:
+        self._scan(self._tail, final=True)
+        self._tail, self._pos = "", 0
+        return self.counts, self.snippets
+
+    def _scan(self, buf: str, final: bool) -> None:
+        limit = len(buf) if final else len(buf) - STREAM_OVERLAP
+        resume = max(limit, self._pos)
+        for m in self.matcher.finditer(buf, self._pos):
+            if m.end() > limit:
+                resume = m.start()
+                break
+            # validate only after the boundary check, so a number cut by the chunk edge is retried whole
+            if _is_valid(m):
+                self._record(m, buf)
+        # keep a little text before the resume point: \b needs the left neighbour, snippets want context
+        start = max(resume - SNIPPET_CONTEXT, 0)
+        self._tail = buf[start:]
+        self._pos = resume - start
+
+    def _record(self, m: "re.Match", buf: str) -> None:
+        rule = m.lastgroup
+        self.counts[rule] = self.counts.get(rule, 0) + 1
+        if len(self.snippets) < self.max_snippets:
+            keep = 4 if RULE_CATEGORY[rule] == "financial" else len(m.group())
+            left = buf[max(m.start() - SNIPPET_CONTEXT, 0):m.start()]
+            right = buf[m.end():m.end() + SNIPPET_CONTEXT]
+            snippet = _redact(left) + "[" + _redact(m.group(), keep) + "]" + _redact(right)
+            self.snippets.append(" ".join(snippet.split()))
+
+
 def contains_financial_data(event: Any) -> bool:
     """
     Check if the event text or headers contain financial data.
     """
-    text = _extract_event_text(event)
-    for pattern in FINANCIAL_PATTERNS:
-        if pattern.search(text):
-            return True
-    return False
+    return "financial" in evaluate_event(event).categories
 
 
 def contains_phi_data(event: Any) -> bool:
     """
     Check if the event text or headers contain PHI data.
     """
-    text = _extract_event_text(event).lower()
-    return any(keyword in text for keyword in PHI_KEYWORDS)
+    return "phi" in evaluate_event(event).categories
+
+
+# ======================
+# Per-event evaluation context
+# ======================
+class RuleContext:
+    """
+    Rule results for one event: the content hash they were computed from,
+    hits per rule id and the categories that fired.
+    """
+    __slots__ = ("digest", "hits", "categories")
+
+    def __init__(self, digest: bytes, hits: Dict[str, int]):
+        self.digest = digest
+        self.hits = hits
+        self.categories = {RULE_CATEGORY[rule] for rule in hits}
+
+
+def evaluate_event(event: Any) -> RuleContext:
+    """
+    Extract the event text once, run the matcher once, and cache the result on the event.
+    The cache is keyed by a hash of the extracted text, so an edited event is re-evaluated
+    and an unchanged one skips the scan. Dicts are evaluated but not cached.
+    """
+    text = _extract_event_text(event)
+    digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    cached = getattr(event, "_rule_context", None)
+    if isinstance(cached, RuleContext) and cached.digest == digest:
+        return cached
+    context = RuleContext(digest, match_rules(text))
+    if not isinstance(event, dict):
+        try:
+            event._rule_context = context
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return context
 
 
 # ======================
 # Utility
 # ======================
+# Scoring outputs written back onto events; not content, so never scanned or hashed
+SCORE_FIELDS = {"risk", "risk_reason", "description", "anomaly_score"}
+# Results of the crawl-time body scan; the rulebook tests them as fields instead
+BODY_SCAN_FIELDS = {"body_matches", "body_snippets"}
+_NOT_SCANNED = SCORE_FIELDS | BODY_SCAN_FIELDS
+
+
 def _extract_event_text(event: Any) -> str:
     """
     Flatten event attributes into text for scanning.
@@ -56,42 +290,433 @@ def _extract_event_text(event: Any) -> str:
     if isinstance(event, dict):
         parts = []
         for k, v in event.items():
-            parts.append(str(v))
+            if k not in _NOT_SCANNED:
+                parts.append(str(v))
         return " ".join(parts)
 
     # If Pydantic model
+    if hasattr(event, "model_dump"):
+        return " ".join(str(v) for v in event.model_dump(exclude=_NOT_SCANNED).values())
     if hasattr(event, "dict"):
-        return " ".join(str(v) for v in event.dict().values())
+        return " ".join(str(v) for k, v in event.dict().items() if k not in _NOT_SCANNED)
 
     return str(event)
+
+
 # ======================
-# Dashboard Scoring Events 
+# Rulebook
 # ======================
-def score(events):
-    results = []
-    for event in events:
-        risk = 0
+logger = logging.getLogger("sea-sec")
+
+RULEBOOK_PATH = Path(os.getenv("RULEBOOK_PATH", Path(__file__).with_name("rulebook.yaml")))
+RULEBOOK_CHECK_SECONDS = float(os.getenv("RULEBOOK_CHECK_SECONDS", "2"))
+MAX_RISK = 10  # default when the rulebook does not set max_risk
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+    "truthy": lambda actual, _: bool(actual),
+}
+_DEFAULT_COST = {"field": 1, "body": 2, "category": 10}
+
+
+# ======================
+# Rule instrumentation
+# ======================
+# Off by default. When on, the plan is compiled with every rule test wrapped in a timer;
+# when off, the plain tests run and nothing is counted, so the normal path pays nothing.
+RULE_STATS_ENABLED = os.getenv("RULE_STATS_ENABLED", "0") == "1"
+
+
+class RuleStats:
+    """
+    Per-rule counters: events tested, hits, test calls (one per batch) and cumulative seconds.
+    Shared by every instrumented plan in the process; parallel workers send theirs back with
+    each shard and the parent merges them in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules: Dict[str, List[float]] = {}
+        self.since = time.time()
+
+    def record(self, rule_id: str, tested: int, hits: int, seconds: float) -> None:
+        with self._lock:
+            row = self._rules.setdefault(rule_id, [0, 0, 0, 0.0])
+            row[0] += tested
+            row[1] += hits
+            row[2] += 1
+            row[3] += seconds
+
+    def merge(self, raw: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for rule_id, (tested, hits, calls, seconds) in raw.items():
+                row = self._rules.setdefault(rule_id, [0, 0, 0, 0.0])
+                row[0] += tested
+                row[1] += hits
+                row[2] += calls
+                row[3] += seconds
+
+    def drain(self) -> Dict[str, List[float]]:
+        """Return the raw counters and start over (used by workers after each shard)."""
+        with self._lock:
+            raw, self._rules = self._rules, {}
+        return raw
+
+    def reset(self) -> None:
+        with self._lock:
+            self._rules = {}
+            self.since = time.time()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rules = {rule_id: list(row) for rule_id, row in self._rules.items()}
+        return {
+            rule_id: {
+                "invocations": int(tested),
+                "hits": int(hits),
+                "hit_rate": round(hits / tested, 4) if tested else 0.0,
+                "batches": int(calls),
+                "seconds": round(seconds, 6),
+                "us_per_event": round(seconds * 1e6 / tested, 3) if tested else 0.0,
+            }
+            for rule_id, (tested, hits, calls, seconds) in sorted(rules.items(), key=lambda kv: -kv[1][3])
+        }
+
+
+RULE_STATS = RuleStats()
+
+
+def _timed(rule_id: str, test: Callable, stats: RuleStats) -> Callable:
+    perf_counter = time.perf_counter
+
+    def timed_test(events, idx, memo):
+        started = perf_counter()
+        result = test(events, idx, memo)
+        stats.record(rule_id, len(idx), int(np.count_nonzero(result)), perf_counter() - started)
+        return result
+
+    return timed_test
+
+
+class CompiledRule:
+    """
+    One rulebook entry turned into a batch predicate.
+    test(events, idx, categories) returns a bool array for events[idx]; `categories` is the
+    plan's per-batch memo so every category rule shares one evaluate_event call per event.
+    """
+    __slots__ = ("id", "kind", "cost", "points", "force", "test")
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.id = spec.get("id")
+        if not self.id:
+            raise ValueError(f"rule without id: {spec}")
+        if ("points" in spec) == ("force" in spec):
+            raise ValueError(f"rule {self.id}: exactly one of points/force is required")
+        self.points = spec.get("points", 0)
+        self.force = spec.get("force")
+
+        if "field" in spec:
+            self.kind = "field"
+            field, op_name, expected = spec["field"], spec.get("op", "eq"), spec.get("value")
+            if op_name not in _OPS:
+                raise ValueError(f"rule {self.id}: unknown op {op_name!r}")
+            op = _OPS[op_name]
+            get = operator.attrgetter(field)
+
+            def test(events, idx, categories):
+                # Pull the column with a C-level attrgetter, then compare it in one numpy op
+                try:
+                    column = list(map(get, events)) if len(idx) == len(events) else [get(events[i]) for i in idx.tolist()]
+                except AttributeError:
+                    column = [getattr(events[i], field, None) for i in idx.tolist()]
+                if op_name == "truthy":
+                    return np.fromiter(map(bool, column), dtype=bool, count=len(idx))
+                try:
+                    result = op(np.asarray(column), expected)
+                    if isinstance(result, np.ndarray) and result.dtype == bool:
+                        return result
+                except TypeError:  # e.g. None in a column compared with gt/lt
+                    pass
+                return np.fromiter(map(compare, column), dtype=bool, count=len(idx))
+
+            def compare(value):
+                # Per-value path: a value that cannot be compared (None, wrong type) does not match
+                try:
+                    return bool(op(value, expected))
+                except TypeError:
+                    return False
+
+            self.test = test
+        elif "body" in spec:
+            # Hits from the crawl-time body scan (event.body_matches), summed per category;
+            # financial hits there have already passed VALIDATORS
+            self.kind = "body"
+            category, min_hits = spec["body"], spec.get("min_hits", 1)
+            if category not in set(RULE_CATEGORY.values()):
+                raise ValueError(f"rule {self.id}: unknown category {category!r}")
+            rules = [rule for rule, cat in RULE_CATEGORY.items() if cat == category]
+
+            def test(events, idx, memo):
+                out = np.empty(len(idx), dtype=bool)
+                for j, i in enumerate(idx.tolist()):
+                    found = getattr(events[i], "body_matches", None) or {}
+                    out[j] = sum(found.get(rule, 0) for rule in rules) >= min_hits
+                return out
+
+            self.test = test
+        elif "category" in spec:
+            self.kind = "category"
+            category = spec["category"]
+            if category not in set(RULE_CATEGORY.values()):
+                raise ValueError(f"rule {self.id}: unknown category {category!r}")
+
+            def test(events, idx, memo):
+                out = np.empty(len(idx), dtype=bool)
+                for j, i in enumerate(idx.tolist()):
+                    cats = memo[i]
+                    if cats is None:
+                        cats = memo[i] = evaluate_event(events[i]).categories
+                    out[j] = category in cats
+                return out
+
+            self.test = test
+        else:
+            raise ValueError(f"rule {self.id}: needs a field, body or category condition")
+        self.cost = spec.get("cost", _DEFAULT_COST[self.kind])
+
+
+class RulePlan:
+    """
+    A compiled rulebook: rules ordered cheapest first, evaluated column-wise over a batch.
+    An event drops out as soon as a force rule fires, and points rules are skipped for
+    events already at max_risk, so the matcher only runs where it can still change the score.
+    """
+
+    def __init__(self, book: Dict[str, Any], version: str, stats: Optional[RuleStats] = None):
+        self.version = version
+        self.max_risk = book.get("max_risk", MAX_RISK)
+        self.rules = sorted((CompiledRule(spec) for spec in book.get("rules", [])), key=lambda r: r.cost)
+        ids = [rule.id for rule in self.rules]
+        if len(ids) != len(set(ids)):
+            raise ValueError("duplicate rule ids in rulebook")
+        self.instrumented = stats is not None
+        if stats is not None:
+            for rule in self.rules:
+                rule.test = _timed(rule.id, rule.test, stats)
+
+    def evaluate(self, events: List[Any]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        n = len(events)
+        points = np.zeros(n)
+        forced = np.full(n, np.nan)
+        open_ = np.ones(n, dtype=bool)   # no force rule has fired yet
+        fired = {rule.id: np.zeros(n, dtype=bool) for rule in self.rules}
+        categories: List[Optional[set]] = [None] * n
+        for rule in self.rules:
+            mask = open_ if rule.force is not None else open_ & (points < self.max_risk)
+            idx = np.flatnonzero(mask)
+            if not len(idx):
+                continue
+            hits = idx[rule.test(events, idx, categories)]
+            fired[rule.id][hits] = True
+            if rule.force is not None:
+                forced[hits] = rule.force
+                open_[hits] = False
+            else:
+                points[hits] += rule.points
+        risk = np.where(np.isnan(forced), np.minimum(points, self.max_risk), forced)
+        return risk, fired
+
 
-        # Base scoring rules (example)
-        if event.has_login_form:
-            risk += 2
-        if not event.https:
-            risk += 3
+def _read_rulebook(path: Path) -> Tuple[Dict[str, Any], str]:
+    raw = path.read_bytes()
+    if path.suffix in (".yaml", ".yml"):
+        import yaml
+        book = yaml.safe_load(raw)
+    else:
+        book = json.loads(raw)
+    return book or {}, hashlib.sha256(raw).hexdigest()[:12]
 
-        # Check for financial data
-        if contains_financial_data(event):
-            risk += 5   # 🚨 raise risk heavily
 
-        # Check for PHI data
-        if contains_phi_data(event):
-            risk += 5   # 🚨 raise risk heavily
+class RuleEngine:
+    """
+    Holds the compiled plan for a rulebook file and recompiles it when the file changes.
+    The file is stat'ed at most every check_seconds; a broken edit is logged and the
+    previous plan keeps serving.
+    """
+
+    def __init__(self, path: Path, check_seconds: float = RULEBOOK_CHECK_SECONDS,
+                 stats: Optional[RuleStats] = None):
+        self.path = Path(path)
+        self.check_seconds = check_seconds
+        self.stats = stats
+        self._plan: Optional[RulePlan] = None
+        self._book: Optional[Dict[str, Any]] = None   # parsed rulebook behind _plan
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def plan(self) -> RulePlan:
+        now = time.monotonic()
+        if self._plan is not None and now - self._checked_at < self.check_seconds:
+            return self._plan
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = self.path.stat().st_mtime_ns
+            except OSError as e:
+                if self._plan is None:
+                    raise
+                logger.error(f"Rulebook {self.path} unreadable, keeping version {self._plan.version}: {e}")
+                return self._plan
+            if self._plan is None or mtime != self._mtime:
+                try:
+                    book, version = _read_rulebook(self.path)
+                    self._plan = RulePlan(book, version, self.stats)
+                    self._book = book
+                    self._mtime = mtime
+                    logger.info(f"Rulebook {self.path.name} compiled (version {version}, {len(self._plan.rules)} rules)")
+                except Exception as e:
+                    if self._plan is None:
+                        raise
+                    logger.error(f"Rulebook reload failed, keeping version {self._plan.version}: {e}")
+                    self._mtime = mtime
+            return self._plan
+
+    def set_stats(self, stats: Optional[RuleStats]) -> None:
+        """
+        Switch instrumentation on (a RuleStats) or off (None). The current plan is rebuilt
+        from the rulebook it was compiled from, not re-read from disk, and swapped in whole,
+        so plan() never sees a gap and a broken file on disk cannot take scoring down.
+        """
+        with self._lock:
+            self.stats = stats
+            if self._plan is None:
+                return  # the first plan() compiles with these stats
+            try:
+                self._plan = RulePlan(self._book, self._plan.version, stats)
+            except Exception as e:
+                logger.error(f"Rulebook recompile for instrumentation failed, keeping version {self._plan.version}: {e}")
+
+
+ENGINE = RuleEngine(RULEBOOK_PATH, stats=RULE_STATS if RULE_STATS_ENABLED else None)
+
+
+# ======================
+# Parallel Scoring
+# ======================
+# Batches at or above PARALLEL_MIN_EVENTS are sharded across a process pool; smaller ones
+# stay serial because pickling events to the workers costs more than it saves.
+PARALLEL_MIN_EVENTS = int(os.getenv("PARALLEL_MIN_EVENTS", "20000"))
+PARALLEL_SHARD_SIZE = int(os.getenv("PARALLEL_SHARD_SIZE", "5000"))
+RULE_WORKERS = int(os.getenv("RULE_WORKERS", "0")) or (os.cpu_count() or 1)
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _init_worker(rulebook_path: str, instrumented: bool) -> None:
+    """Runs once per worker process: compile the rulebook so shards only pay for evaluation."""
+    global ENGINE
+    ENGINE = RuleEngine(Path(rulebook_path), stats=RULE_STATS if instrumented else None)
+    ENGINE.plan()
+
+
+def _score_shard(events: List[Any], instrumented: bool):
+    if instrumented != (ENGINE.stats is not None):
+        ENGINE.set_stats(RULE_STATS if instrumented else None)
+    risk, fired = ENGINE.plan().evaluate(events)
+    return risk, fired, RULE_STATS.drain() if instrumented else None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # spawn, not fork: the API process runs threads, and forking those is not safe
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(
+                max_workers=RULE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(str(ENGINE.path), ENGINE.stats is not None),
+            )
+        return _POOL
+
 
-        # Normalize or clamp score
-        risk = min(risk, 10)
+def shutdown_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(cancel_futures=True)
+            _POOL = None
 
-	#the line below forces high score if either phi and financial 		data is involved.  
-	if contains_financial_data(event) or contains_phi_data(event):
-    	risk = 10
 
-        results.append({"event": event, "risk": risk})
-    return results
+atexit.register(shutdown_pool)
+
+
+def _score_parallel(events: List[Any]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    shards = [events[i:i + PARALLEL_SHARD_SIZE] for i in range(0, len(events), PARALLEL_SHARD_SIZE)]
+    # Executor.map yields results in submission order, so shards concatenate back in event order
+    instrumented = ENGINE.stats is not None
+    results = list(_get_pool().map(_score_shard, shards, [instrumented] * len(shards)))
+    for _, _, stats in results:
+        if stats:
+            ENGINE.stats.merge(stats)
+    risk = np.concatenate([r for r, _, _ in results])
+    names = list(dict.fromkeys(name for _, fired, _ in results for name in fired))
+    fired = {
+        name: np.concatenate([f.get(name, np.zeros(len(r), dtype=bool)) for r, f, _ in results])
+        for name in names
+    }
+    return risk, fired
+
+
+# ======================
+# Batch Scoring
+# ======================
+def score_batch(events: List[Any], parallel: Optional[bool] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Evaluate the rulebook over a batch in one pass.
+    Returns (risk, components): one fired-or-not array per rule id, aligned with events.
+    parallel=None picks the process pool only for batches of PARALLEL_MIN_EVENTS or more;
+    True / False force it on or off. Anything that fits in one shard is scored serially.
+    """
+    if parallel is None:
+        parallel = len(events) >= PARALLEL_MIN_EVENTS
+    if parallel and RULE_WORKERS > 1 and len(events) > PARALLEL_SHARD_SIZE:
+        try:
+            return _score_parallel(events)
+        except (OSError, RuntimeError) as e:  # includes BrokenProcessPool
+            shutdown_pool()
+            logger.warning(f"Parallel rule scoring unavailable, scoring serially: {e}")
+    return ENGINE.plan().evaluate(events)
+
+
+def rule_stats() -> Dict[str, Any]:
+    """Counters for the /rules/stats endpoint and the report summary."""
+    return {
+        "enabled": ENGINE.stats is not None,
+        "rulebook_version": ENGINE.plan().version,
+        "since": RULE_STATS.since,
+        "rules": RULE_STATS.snapshot(),
+    }
+
+
+def set_rule_stats(enabled: bool, reset: bool = False) -> None:
+    """Turn instrumentation on or off at runtime; reset clears the counters."""
+    if reset:
+        RULE_STATS.reset()
+    if enabled != (ENGINE.stats is not None):
+        ENGINE.set_stats(RULE_STATS if enabled else None)
+
+
+# ======================
+# Dashboard Scoring Events 
+# ======================
+def score(events):
+    risk, _ = score_batch(events)
+    return [{"event": event, "risk": int(r)} for event, r in zip(events, risk)]